@@ -1,75 +1,156 @@
 #!/usr/bin/env python3
 
+import ijson
+import orjson
 import pysolr
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, wait
+
+# Shared HTTP session, so that all searches and adds reuse pooled
+# keep-alive connections instead of opening a new one per request.
+# Connection errors and overloaded responses are retried with backoff.
+# The atomic updates only set values, so retrying a POST is safe.
+retries = Retry(total=5, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504),
+                allowed_methods=frozenset({'GET', 'POST'}))
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+# Ask for compressed responses, the exported JSON compresses well.
+session.headers.update({'Connection': 'keep-alive',
+                        'Accept-Encoding': 'gzip, deflate'})
+
+
+class OrjsonCodec:
+    """JSON encoder/decoder for pysolr using orjson"""
+
+    def encode(self, obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def decode(self, s):
+        return orjson.loads(s)
+
+
+# Fields Solr generates itself, which must be removed before a document
+# can be added again.
+BLOCKED = frozenset({'full_text', 'bbox__maxX', 'bbox__maxY', 'bbox__minX',
+                     'bbox__minY', 'bbox_rpt', 'ss_access', '_version_'})
+
+
+# The flags are changed with atomic updates, so only the id and the current
+# parent flag has to be read. Solr rebuilds the rest of the document from
+# its stored fields, after clearing the fields it generates itself.
+# _version_ is maintained by Solr and is left alone.
+CLEARED = BLOCKED - {'_version_'}
+FIELD_UPDATES = dict.fromkeys(('isChild', 'isParent') + tuple(sorted(CLEARED)), 'set')
+
+
+# The whole result set is read in one request from the /export handler,
+# which streams sorted results without paging or scoring. The exported
+# fields and the sort field must have docValues.
+# Every update sets isChild, so the filter query already skips documents
+# handled by an earlier run and they are never read or posted again.
+# The parameters are kept as pairs, which requests encodes as they are.
+EXPORT_PARAMS = (('q', '*:*'), ('fq', '-isChild:[* TO *]'), ('fl', 'id,isParent'),
+                 ('sort', 'id asc'), ('wt', 'json'))
 
 
 def handleResults(doc):
-    newdoc = doc
-    # print(doc['id'])
-    if 'full_text' in newdoc:
-        newdoc.pop('full_text')
-    if 'bbox__maxX' in newdoc:
-        newdoc.pop('bbox__maxX')
-    if 'bbox__maxY' in newdoc:
-        newdoc.pop('bbox__maxY')
-    if 'bbox__minX' in newdoc:
-        newdoc.pop('bbox__minX')
-    if 'bbox__minY' in newdoc:
-        newdoc.pop('bbox__minY')
-    if 'bbox_rpt' in newdoc:
-        newdoc.pop('bbox_rpt')
-    if 'ss_access' in newdoc:
-        newdoc.pop('ss_access')
-    if '_version_' in newdoc:
-        newdoc.pop('_version_')
-    if 'isParent' in newdoc and newdoc['isParent'] is True:
+    """Return an atomic update setting the parent/child flags of doc"""
+    update = {'id': doc['id']}
+    update.update(dict.fromkeys(CLEARED))
+    if doc.get('isParent') is True:
         print("Found parent")
-        newdoc.update({'isChild': True})
-        newdoc.update({'isParent': False})
+        update['isChild'] = True
     else:
-        newdoc.update({'isChild': False})
-        newdoc.update({'isParent': False})
+        update['isChild'] = False
+    update['isParent'] = False
+
+    return update
+
+
+def stream_docs(solrcon, handler, params, meta):
+    """
+    Yield the documents of a Solr JSON response while the response is read,
+    so that the result set is never decoded into memory as a whole.
+    numFound is stored in meta when it is seen.
+    """
+    with session.get(solrcon.url + '/' + handler, params=params, stream=True,
+                     auth=solrcon.auth, timeout=solrcon.timeout) as res:
+        res.raise_for_status()
+        # Let urllib3 inflate a gzip encoded response before it is parsed
+        res.raw.decode_content = True
+        builder = None
+        for prefix, event, value in ijson.parse(res.raw):
+            if prefix == 'response.docs.item':
+                if event == 'start_map':
+                    builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                if event == 'end_map':
+                    yield builder.value
+            elif prefix.startswith('response.docs.item.'):
+                builder.event(event, value)
+            elif prefix == 'response.numFound':
+                meta[prefix] = value
 
-    return newdoc
+
+def add_docs(solrcon, docs):
+    """Send a batch of atomic updates to Solr, reporting failures"""
+    try:
+        solrcon.add(docs, fieldUpdates=FIELD_UPDATES)
+    except Exception as e:
+        print("Error adding documents to Solr: %s" % e)
 
 
 def main():
 
-    search_rows = 100
-    search_start = 0
+    # Adds are kept moderately sized so that each POST stays well below the
+    # request size limits in Jetty.
+    add_batch = 500
+    threads = 8
 
     solrcon = pysolr.Solr('http://157.249.74.44:8983/solr/testcore',
-                          always_commit=False, timeout=1020,
-                          auth=None)
-
-    results = solrcon.search('*:*', fq='-isChild:[* TO *]', rows=0, start=0)
-    print(results.hits)
-    hits = results.hits
-
-    while (search_start + search_rows) <= hits:
-        print(search_start + search_rows)
-        results = solrcon.search('*:*', fq='-isChild:[* TO *]',
-                                 rows=search_rows, start=search_start)
-
-        docs = list(results)
-        newdocs = list()
-        # for (doc, newdoc) in concurrently(fn=handleResults, inputs=docs,
-        #                                  max_concurrency=8):
-        for doc in docs:
-            newdoc = handleResults(doc)
-            newdocs.append(newdoc)
-
-        # Futures.ALL_COMPLETED
-        # print(len(newdocs))
-        try:
-            solrcon.add(newdocs)
-        except Exception as e:
-            print("Error adding documents to Solr: %s", e)
-
-        del docs
-        del newdocs
-        del results
-        search_start += search_rows
+                          always_commit=False, timeout=(5, 120),
+                          auth=None, session=session,
+                          encoder=OrjsonCodec(), decoder=OrjsonCodec())
+
+    # Documents are transformed while the response is streamed, and the adds
+    # are posted concurrently in the thread pool. The number of adds in
+    # flight is bounded to limit memory use. Up to one extra batch per worker
+    # may be queued, so a worker starts on the next batch as soon as its
+    # previous add returns while the export stream keeps being read.
+    # Each batch is filled into a list allocated at full size up front. A
+    # batch list is handed over to the pool, so a fresh one is allocated for
+    # the next batch rather than overwriting one that may still be posted.
+    # handleResults only builds a small dict per document, so it is run
+    # in-process; handing documents to a process pool would cost more in
+    # pickling than the transform itself.
+    meta = {}
+    pending = set()
+    newdocs = [None] * add_batch
+    n = 0
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for doc in stream_docs(solrcon, 'export', EXPORT_PARAMS, meta):
+            newdocs[n] = handleResults(doc)
+            n += 1
+            if n == add_batch:
+                if len(pending) >= 2 * threads:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(executor.submit(add_docs, solrcon, newdocs))
+                newdocs = [None] * add_batch
+                n = 0
+
+        if n > 0:
+            pending.add(executor.submit(add_docs, solrcon, newdocs[:n]))
+        # All adds must have finished before the final commit
+        wait(pending, return_when=ALL_COMPLETED)
+
+    print(meta.get('response.numFound'))
+    solrcon.commit()
 
 
 if __name__ == '__main__':
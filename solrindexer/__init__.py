@@ -24,12 +24,28 @@ import sys
 
 from .indexdata import IndexMMD
 from .indexdata import MMD4SolR
+from .indexdata import SolrBatcher
 from .bulkindexer import BulkIndexer
 
 __package__ = "solrindexer"
 __version__ = "2.1.0"
 __date__ = "2024-01-23"
-__all__ = ["IndexMMD", "MMD4SolR", "BulkIndexer"]
+__all__ = ["IndexMMD", "MMD4SolR", "SolrBatcher", "BulkIndexer"]
+
+# Log message formats
+_FMT_DEBUG = ("[{asctime:}] [{thread:d}] [{threadName:s}]"
+              " {name:>28}:{lineno:<4d} {levelname:8s} {message:}")
+_FMT_INFO = "[{asctime:}] [{processName:s}] [{threadName:s}] {levelname:8s} {message:}"
+_FMT_STDOUT = "[{asctime:}] [{processName:s}] [{threadName:s}] {message:}"
+
+# Valid values of SOLRINDEXER_LOGLEVEL
+_LEVELS = {
+    "CRITICAL": logging.CRITICAL,
+    "ERROR": logging.ERROR,
+    "WARNING": logging.WARNING,
+    "INFO": logging.INFO,
+    "DEBUG": logging.DEBUG,
+}
 
 
 class InfoFilter(logging.Filter):
@@ -39,25 +55,26 @@ class InfoFilter(logging.Filter):
 
 def _init_logging(log_obj):
     """Call to initialise logging."""
+    # Only add the handlers once, even if called again for the same logger
+    if getattr(log_obj, "_solrindexer_configured", False):
+        return
+
     # Read environment variables
     want_level = os.environ.get("SOLRINDEXER_LOGLEVEL", "INFO")
     log_file = os.environ.get("SOLRINDEXER_LOGFILE", None)
 
     # Determine log level and format
-    if hasattr(logging, want_level):
-        log_level = getattr(logging, want_level)
-    else:
+    log_level = _LEVELS.get(want_level)
+    if log_level is None:
         print(
             "Invalid logging level '%s' in environment variable SOLRINDEXER_LOGLEVEL" % want_level)
         log_level = logging.INFO
 
+    debug_log_format = logging.Formatter(fmt=_FMT_DEBUG, style="{")
     if log_level < logging.INFO:
-        msg_format = "[{asctime:}] [{thread:d}] [{threadName:s}]"
-        msg_format += " {name:>28}:{lineno:<4d} {levelname:8s} {message:}"
+        log_format = debug_log_format
     else:
-        msg_format = "[{asctime:}] [{processName:s}] [{threadName:s}] {levelname:8s} {message:}"
-
-    log_format = logging.Formatter(fmt=msg_format, style="{")
+        log_format = logging.Formatter(fmt=_FMT_INFO, style="{")
     log_obj.setLevel(log_level)
 
     # Create stream handlers
@@ -73,8 +90,7 @@ def _init_logging(log_obj):
         log_obj.addHandler(h_file)
 
     # Create a handler for stdout, set its level to INFO.
-    stdout_format = "[{asctime:}] [{processName:s}] [{threadName:s}] {message:}"
-    stdout_log_format = logging.Formatter(fmt=stdout_format, style="{")
+    stdout_log_format = logging.Formatter(fmt=_FMT_STDOUT, style="{")
     stdout_handler = logging.StreamHandler(sys.stdout)
     if log_level == logging.INFO:
         stdout_handler.setLevel(logging.INFO)
@@ -85,12 +101,9 @@ def _init_logging(log_obj):
         stdout_handler.setFormatter(log_format)
 
     # Create a handler for stderr, set its level to WARNING.
-    stderr_format = "[{asctime:}] [{thread:d}] [{threadName:s}]"
-    stderr_format += " {name:>28}:{lineno:<4d} {levelname:8s} {message:}"
     stderr_handler = logging.StreamHandler(sys.stderr)
-    stderr_log_format = logging.Formatter(fmt=stderr_format, style="{")
     stderr_handler.setLevel(logging.WARNING)
-    stderr_handler.setFormatter(stderr_log_format)
+    stderr_handler.setFormatter(debug_log_format)
 
     # Add the handlers to the logger.
     log_obj.addHandler(stdout_handler)
@@ -103,6 +116,7 @@ def _init_logging(log_obj):
     # whether a incoming message should be processed.
     # logger.setLevel(logging.INFO)
 
+    log_obj._solrindexer_configured = True
     return
 
 
@@ -17,6 +17,8 @@ implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
+import os
+import re
 import logging
 import threading
 import queue
@@ -27,16 +29,113 @@ from solrindexer.indexdata import MMD4SolR
 from solrindexer.indexdata import IndexMMD
 
 from solrindexer.tools import to_solr_id, process_feature_type
-from solrindexer.tools import create_wms_thumbnail, get_dataset, solr_add
+from solrindexer.tools import create_wms_thumbnail, get_datasets, get_existing_ids, solr_add
 from solrindexer.tools import create_wms_thumbnail_api_wrapper
 from solrindexer.multithread.io import load_file
-from solrindexer.multithread.threads import concurrently, multiprocess
+from solrindexer.multithread.threads import multiprocess
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from concurrent import futures as Futures
 
 logger = logging.getLogger(__name__)
 
+# Limits for the batch size when it is adapted to the indexing speed.
+# The batch size is set so that adding a batch to solr takes about TARGET_POST_SECS.
+TARGET_POST_SECS = 5
+MIN_CHUNKSIZE = 500
+MAX_CHUNKSIZE = 20000
+
+# NPI refers to parents by their dataset url, strip it down to the id
+NPI_RE = re.compile(r'https://data\.npolar\.no/dataset/|http://(?:data|api)\.npolar\.no/dataset/'
+                    r'|\.xml')
+
+
+def mmd2solr(mmd, status, file):
+    """
+    Convert mmd dict to solr dict
+
+    Check for presence of children and mark them as children.
+    If children found return parentid together with the solrdoc
+    """
+
+    if mmd is None:
+        logger.warning("File %s was not parsed" % file)
+        return (None, status)
+    if file is not None and file.endswith('\n'):
+        file = file[:-1]
+    mydoc = MMD4SolR(filename=None, mydoc=mmd, bulkFile=file)
+    try:
+        mydoc.check_mmd()
+    except Exception as e:
+        logger.error(
+            "File %s did not pass the mmd check, cannot index. Reason: %s" % (file, e))
+        return (None, status)
+
+    # Convert mmd xml dict to solr dict
+    try:
+        tmpdoc = mydoc.tosolr()
+    except Exception as e:
+        logger.error(
+            "File %s could not be converted to solr document. Reason: %s" % (file, e))
+        return (None, status)
+
+    """ Do some sanity checking of the documents and skip docs with problems"""
+    if tmpdoc is None:
+        logger.warning("Solr document for file %s was empty", file)
+        return (None, status)
+
+    myid = tmpdoc.get('id')
+    if myid is None or myid == 'Unknown':
+        logger.warning(
+            "Skipping process file %s. Metadata identifier: Unknown, or missing", file)
+        return (None, status)
+
+    if 'temporal_extent_start_date' not in tmpdoc:
+        logger.error("Could not find start date in  %s.", file)
+        return (None, status)
+
+    if 'related_dataset' in tmpdoc:
+        logger.debug("got related dataset")
+        if isinstance(tmpdoc['related_dataset'], str):
+            logger.debug("processing child")
+            # Manipulate the related_dataset id to solr id
+            # Special fix for NPI
+            tmpdoc['related_dataset'] = NPI_RE.sub('', tmpdoc['related_dataset'])
+            # Skip if DOI is used to refer to parent, that isn't consistent.
+            if 'doi.org' not in tmpdoc['related_dataset']:
+                # Update document with child specific fields
+                tmpdoc['dataset_type'] = 'Level-2'
+                tmpdoc['isChild'] = True
+                # tmpdoc['isParent'] = False
+
+                # Fix special characters that SolR doesn't like
+                myparentid = tmpdoc['related_dataset'].strip()
+                tmpdoc['related_dataset'] = myparentid
+                mysolrparentid = to_solr_id(myparentid)
+                tmpdoc['related_dataset_id'] = mysolrparentid
+                status = mysolrparentid
+
+    else:
+        # Assume we have level-1 doc that are not parent
+        tmpdoc['dataset_type'] = 'Level-1'
+        tmpdoc['isParent'] = False
+
+    return (tmpdoc, status)
+
+
+def load_and_convert(file):
+    """
+    Load and convert one mmd file to a solr document.
+    Used as the worker function for the process pool in bulkindex,
+    so that parsing and conversion run outside the indexing process.
+    Documents with an opendap url have their feature type processed
+    here too, so they come back from the worker ready for indexing.
+    """
+    doc, status = mmd2solr(load_file(file), None, file)
+    if doc is not None and 'data_access_url_opendap' in doc:
+        doc = process_feature_type(doc)
+    return doc, status
+
 
 class BulkIndexer(object):
     """ Do multithreaded bulkindexing given a list of file names.
@@ -50,22 +149,34 @@ class BulkIndexer(object):
         Full SolR url to ingest to
     threads : int
         number of threads
+    processes : int
+        number of processes parsing and converting files,
+        defaults to the number of cpus
     chunksize : int
         number of documents to process in each batch
     auth : obj
         valid authentication object for SolR
+    skip_existing : bool
+        do not index documents that are already in the index
+    adaptive : bool
+        adapt the batch size to how fast solr indexes the documents
     """
 
     def __init__(self, inputList, solr_url, threads=20, chunksize=2500, auth=None,
-                 tflg=False, thumbClass=None):
+                 tflg=False, thumbClass=None, skip_existing=False, adaptive=False,
+                 processes=None):
         """ Initialize BulkIndexer"""
         logger.debug("Initializing BulkIndexer.")
         self.inputList = inputList
         self.threads = threads
+        self.processes = processes or os.cpu_count() or 1
         self.chunksize = chunksize
         self.total_in = len(inputList)
-        self.indexthreads = list()
         self.thumbClass = thumbClass
+        self.skip_existing = skip_existing
+        self.adaptive = adaptive
+        # Documents indexed per second by the last finished index thread
+        self.index_rate = None
 
         # self.solrcon = pysolr.Solr(solr_url, always_commit=False, timeout=1020, auth=auth)
         # self.  = IndexMMD(solr_url, False, authentication=auth)
@@ -79,96 +190,69 @@ class BulkIndexer(object):
         """
         Convert mmd dict to solr dict
 
-        Check for presence of children and mark them as children.
-        If children found return parentid together with the solrdoc
+        See the module level function mmd2solr
         """
-
-        if mmd is None:
-            logger.warning("File %s was not parsed" % file)
-            return (None, status)
-        if file is not None and file.endswith('\n'):
-            file = file[:-1]
-        mydoc = MMD4SolR(filename=None, mydoc=mmd, bulkFile=file)
-        try:
-            mydoc.check_mmd()
-        except Exception as e:
-            logger.error(
-                "File %s did not pass the mmd check, cannot index. Reason: %s" % (file, e))
-            return (None, status)
-
-        # Convert mmd xml dict to solr dict
-        try:
-            tmpdoc = mydoc.tosolr()
-        except Exception as e:
-            logger.error(
-                "File %s could not be converted to solr document. Reason: %s" % (file, e))
-            return (None, status)
-
-        """ Do some sanity checking of the documents and skip docs with problems"""
-        if tmpdoc is None:
-            logger.warning("Solr document for file %s was empty" % (file))
-            return (None, status)
-
-        if 'id' not in tmpdoc:
-            logger.warning("File %s have no id. Missing metadata_identifier?" % file)
-            return (None, status)
-
-        if tmpdoc['id'] is None or tmpdoc['id'] == 'Unknown':
-            logger.warning(
-                "Skipping process file %s. Metadata identifier: Unknown, or missing" % file)
-            return (None, status)
-
-        if 'temporal_extent_start_date' not in tmpdoc:
-            logger.error("Could not find start date in  %s.", file)
-            return (None, status)
-
-        if 'related_dataset' in tmpdoc:
-            logger.debug("got related dataset")
-            if isinstance(tmpdoc['related_dataset'], str):
-                logger.debug("processing child")
-                # Manipulate the related_dataset id to solr id
-                # Special fix for NPI
-                tmpdoc['related_dataset'] = tmpdoc['related_dataset'].replace(
-                    'https://data.npolar.no/dataset/', '')
-                tmpdoc['related_dataset'] = tmpdoc['related_dataset'].replace(
-                    'http://data.npolar.no/dataset/', '')
-                tmpdoc['related_dataset'] = tmpdoc['related_dataset'].replace(
-                    'http://api.npolar.no/dataset/', '')
-                tmpdoc['related_dataset'] = tmpdoc['related_dataset'].replace(
-                    '.xml', '')
-                # Skip if DOI is used to refer to parent, that isn't consistent.
-                if 'doi.org' not in tmpdoc['related_dataset']:
-                    # Update document with child specific fields
-                    tmpdoc.update({'dataset_type': 'Level-2'})
-                    tmpdoc.update({'isChild': True})
-                    # tmpdoc.update({'isParent': False})
-
-                    # Fix special characters that SolR doesn't like
-                    myparentid = tmpdoc['related_dataset']
-                    tmpdoc.update({'related_dataset': myparentid.strip()})
-                    mysolrparentid = to_solr_id(myparentid)
-                    tmpdoc.update({'related_dataset_id': mysolrparentid})
-                    status = mysolrparentid
-
-        else:
-            # Assume we have level-1 doc that are not parent
-            tmpdoc.update({'dataset_type': 'Level-1'})
-            tmpdoc.update({'isParent': False})
-
-        return (tmpdoc, status)
+        return mmd2solr(mmd, status, file)
 
     def process_mmd(self, mmd_list, status_list):
         """
-        Mutithreaded processing of mmd2solr conversion
+        Processing of mmd2solr conversion using multiple processes
+
+        The documents are returned in the order they complete,
+        each together with its status.
         """
-        with ThreadPoolExecutor(self.threads) as exe:
+        result = list()
+        pending = set()
+        with ProcessPoolExecutor(self.processes) as exe:
             arglist = zip(mmd_list, status_list)
-            # convert mmd to solr doc
-            futures = [exe.submit(self.mmd2solr, item) for item in arglist]
-            # collect data
-            result = [future.result() for future in futures]
-            solr_docs, status = zip(*result)
-            return solr_docs, status
+            # convert mmd to solr doc, keeping a limited number of documents in flight
+            for mmd, status in arglist:
+                if len(pending) >= 2 * self.processes:
+                    done, pending = Futures.wait(pending, return_when=Futures.FIRST_COMPLETED)
+                    result.extend(future.result() for future in done)
+                pending.add(exe.submit(mmd2solr, mmd, status, None))
+            # collect the remaining data
+            result.extend(future.result() for future in Futures.as_completed(pending))
+        solr_docs, status = zip(*result)
+        return solr_docs, status
+
+    def _resolve_parent(self, pid, docs, by_id, index_map, parent_updates, pending, processed):
+        """
+        Flag the dataset pid as parent.
+
+        If the parent is in the current batch (docs, indexed by by_id) it is flagged there.
+        Otherwise it is looked up in index_map, the parents found in the index.
+        If found in the index, an update is added to parent_updates. If not, it is kept as
+        pending. index_map is None if the parent should not be looked for in the index.
+        The pending and processed sets of parent ids are updated accordingly.
+        """
+        if pid in by_id:
+            myparent = docs[by_id[pid]]
+            logger.debug("parent found in current chunk: %s ", pid)
+            if myparent['isParent'] is False:
+                logger.debug('found pending parent %s in this job. updating parent', pid)
+                myparent['isParent'] = True
+                pending.discard(pid)
+                processed.add(pid)
+            return
+
+        if index_map is None:
+            return
+        indexed = index_map.get(pid)
+        if indexed is None:
+            # if not found in the index, we store it for later
+            if pid not in pending:
+                logger.debug('parent %s not found in index. storing it for later', pid)
+                pending.add(pid)
+        else:
+            logger.debug("parent found in index: %s, isParent: %s",
+                         indexed['id'], indexed['isParent'])
+            # Check if already flagged
+            if indexed['isParent'] is False:
+                logger.debug('Update on indexed parent %s, isParent: True', pid)
+                parent_updates.append(IndexMMD._solr_update_parent_doc(indexed))
+                processed.add(pid)
+                pending.discard(pid)
 
     def add2solr(self, docs, error_queue):
         """ Add documents to SolR"""
@@ -187,12 +271,17 @@ class BulkIndexer(object):
                 reason: %s"%(tname, tid, e)
             logger.error(error_msg)
             error_queue.put(str(error_msg))
+            success = False
+        else:
+            success = True
 
-        # If success
         et = time.perf_counter()
         pet = time.process_time()
         elapsed_time = et - st
         pelt = pet - pst
+        # A failed add says nothing about how fast solr indexes
+        if success and elapsed_time > 0:
+            self.index_rate = len(docs) / elapsed_time
         etime = time.strftime("%H:%M:%S", time.gmtime(elapsed_time))
         ctime = time.strftime("%H:%M:%S", time.gmtime(pelt))
         logger.info("-- Indexed %d documents to SolR. Elapsed time: %s, CPU time: %s",
@@ -211,6 +300,7 @@ class BulkIndexer(object):
         parent_ids_pending = set()  # Keep track of pending parent ids
         parent_ids_processed = set()  # Keep track parent ids already processed
         parent_ids_found = set()    # Keep track of parent ids found
+        parent_updates = list()  # Indexed parents to flag, sent once per batch
 
         # Create a queue for solr indexing errors
         index_error_queue = queue.Queue()
@@ -223,301 +313,201 @@ class BulkIndexer(object):
         doc_ids_processed = set()
         # print("######### BATCH START ###########################")
         batch_run = 1
-        for i in range(0, len(filelist), chunksize):
-            logger.info("---- Batch run %d of %d ----",
-                        batch_run, math.ceil(len(filelist) / chunksize))
-            # select a chunk
-            files = filelist[i:(i + chunksize)]
-            docs = list()
-            statuses = list()
-
-            """######################## STARTING THREADS ########################
-            # Load each file using multiple threads, and process documents as files are loaded
-            ###################################################################
-            """
-            logger.info("---- Reading files concurrently %d ----", self.threads)
-            for (file, mmd) in concurrently(fn=load_file, inputs=files,
-                                            max_concurrency=self.threads):
-
-                # Get the processed document and its status
-                doc, status = self.mmd2solr(mmd, None, file)
-
-                # Add the document and the status to the document-list
-                docs.append(doc)
-                statuses.append(status)
-            """################################## THREADS FINISHED ##################"""
-            Futures.ALL_COMPLETED
-            # Check if we got some children in the batch pointing to a parent id
-            parentids = set(
-                [element for element in statuses if element is not None])
-            logger.debug(parentids)
-
-            # Check if the parent(s) of the children(s) was found before.
-            # If not, we add them to found.
-            for pid in parentids:
-                if pid not in parent_ids_found:
-                    parent_ids_found.add(pid)
-                if pid not in parent_ids_pending and pid not in parent_ids_processed:
-                    parent_ids_pending.add(pid)
-
-            # Check if the parent(s) of the children(s) we found was processed.
-            # If so, we do not process agian
-            for pid in parent_ids_processed:
-                if pid in parentids:
-                    parentids.remove(pid)
-            for pid in parent_ids_found:
-                if pid in parentids:
-                    parentids.remove(pid)
-
-            # Files processed so far
-            files_processed += len(files)
-
-            # Gnereate a list of documents to send to solr.
-            # Documents that could not be opened, parsed or converted to solr documents are skipped
-            docs_ = len(docs)  # Number of documents processed
-            # List of documents that can be indexed
-            docs = [el for el in docs if el is not None]
-            # Update # of skipped documents
-            docs_skipped += (docs_ - len(docs))
-
-            # keep track of all document ids we have indexed, so we do not have to check solr
-            # for a parent more than we need
-            docids_ = set([doc['id'] for doc in docs])
-            doc_ids_processed.update(docids_)
-
-            # Process feature types here, using the concurrently function,
-            dap_docs = [
-                doc for doc in docs if 'data_access_url_opendap' in doc]
-            """######################## STARTING THREADS ########################
-            # Load each file using multiple threads, and process documents as files are loaded
-            ###################################################################"""
-            logger.info("---- Process featureType concurrently %d ----", self.threads)
-            for (doc, newdoc) in multiprocess(fn=process_feature_type,
-                                              inputs=dap_docs,
-                                              max_concurrency=self.threads):
-                docs.remove(doc)
-                docs.append(newdoc)
-            """################################## THREADS FINISHED ##################"""
-            Futures.ALL_COMPLETED
-            """TODO: Add wms thumbnail batch creation here."""
-            if self.tflg is True:
-                thumb_docs = [
-                    doc for doc in docs if 'data_access_url_ogc_wms' in doc]
+
+        # Parsing and conversion is CPU bound, and is done in a pool of processes
+        # kept for all batches. Indexing to solr is done in a pool of threads.
+        # The pools are created here and not in __init__, as the BulkIndexer
+        # is pickled when bulkindex is run in a worker process.
+        pool = ProcessPoolExecutor(max_workers=self.processes)
+        index_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="Index")
+        index_futures = list()
+        # Limit the number of batches waiting to be indexed, each holding a batch of documents
+        index_slots = threading.BoundedSemaphore(self.threads)
+
+        def convert(files):
+            """Start loading and converting files in the process pool"""
+            return pool.map(load_and_convert, files,
+                            chunksize=max(1, len(files) // (4 * self.processes)))
+
+        # select the first chunk
+        files = filelist[:chunksize]
+        i = len(files)
+        try:
+            results = convert(files)
+            while len(files) > 0:
+                logger.info("---- Batch run %d of %d ----",
+                            batch_run, batch_run + math.ceil((len(filelist) - i) / chunksize))
+                # Adapt the batch size to the indexing speed, changing it
+                # at most by a factor of two for each batch.
+                if self.adaptive and self.index_rate is not None:
+                    chunksize = min(max(int(self.index_rate * TARGET_POST_SECS),
+                                        chunksize // 2, MIN_CHUNKSIZE),
+                                    chunksize * 2, MAX_CHUNKSIZE)
+                    logger.debug("Batch size adapted to %d", chunksize)
+                # select the next chunk, and start reading and converting it while
+                # this chunk is processed and indexed
+                next_files = filelist[i:(i + chunksize)]
+                i += len(next_files)
+                next_results = convert(next_files)
+
+                # Results come back in file order, so fill presized lists by index
+                docs = [None] * len(files)
+                statuses = [None] * len(files)
+
                 """######################## STARTING THREADS ########################
                 # Load each file using multiple threads, and process documents as files are loaded
-                ###################################################################"""
-                logger.info("---- Creating thumbnails concurrently %d ----", self.threads)
-                if (isinstance(self.thumbClass, dict)):
-                    for (doc, newdoc) in multiprocess(fn=create_wms_thumbnail_api_wrapper,
-                                                      inputs=thumb_docs,
-                                                      max_concurrency=self.threads):
-                        docs.remove(doc)
-                        docs.append(newdoc)
-                else:
-                    for (doc, newdoc) in multiprocess(fn=create_wms_thumbnail,
-                                                      inputs=thumb_docs,
-                                                      max_concurrency=self.threads):
-                        docs.remove(doc)
-                        docs.append(newdoc)
+                ###################################################################
+                """
+                logger.info("---- Reading files using %d processes ----", self.processes)
+                for n, (doc, status) in enumerate(results):
+
+                    # Add the document and the status to the document-list
+                    docs[n] = doc
+                    statuses[n] = status
                 """################################## THREADS FINISHED ##################"""
-            Futures.ALL_COMPLETED
-            # Run over the list of parentids found in this chunk, and look for the parent
-            parent_found = False
-            for pid in parentids:
-                logger.debug("checking parent: %s" % pid)
-                # Firs we check if the parent dataset are in our jobs
-                myparent = None
-                parent = [el for el in docs if el['id'] == pid]
-                logger.debug("parents found in this chunk: %s" % parent)
-
-                # Check if we have the parent in this chunk
-                if len(parent) > 0:
-                    myparent = parent.pop()
-                    myparent_ = myparent
-                    logger.debug("parent found in current chunk: %s " % myparent['id'])
-                    parent_found = True
-                    if myparent['isParent'] is False:
-                        logger.debug('found pending parent %s in this job.' % pid)
-                        logger.debug('updating parent')
-
-                        docs.remove(myparent)  # Remove original
-                        myparent_.update({'isParent': True})
-                        docs.append(myparent_)
-
-                        # Remove from pending list
-                        if pid in parent_ids_pending:
-                            parent_ids_pending.remove(pid)
-
-                        # add to processed list for reference
-                        parent_ids_processed.add(pid)
-
-                # Check if the parent is already in the index, and flag
-                # it as parent if not done already
-                if pid in doc_ids_processed and not parent_found:
-                    myparent = get_dataset(pid)
-
-                    if myparent is not None:
-                        # if not found in the index, we store it for later
-                        if myparent['doc'] is None:
-                            if pid not in parent_ids_pending:
-                                logger.debug(
-                                    'parent %s not found in index. storing it for later' % pid)
-                                parent_ids_pending.add(pid)
-
-                        # If found in index we update the parent
-                        else:
-                            if myparent['doc'] is not None:
-                                logger.debug(
-                                    "parent found in index: %s, isParent: %s",
-                                    (myparent['doc']['id'], myparent['doc']['isParent']))
-                                # Check if already flagged
-                                if myparent['doc']['isParent'] is False:
-                                    logger.debug(
-                                        'Update on indexed parent %s, isParent: True', pid)
-                                    mydoc = IndexMMD._solr_update_parent_doc(myparent['doc'])
-                                    # print(mydoc)
-                                    doc_ = mydoc
-                                    try:
-                                        solr_add([doc_])
-                                    except Exception as e:
-                                        logger.error(
-                                            "Could update parent on index. reason %s", e)
-
-                                    # Update lists
-                                    parent_ids_processed.add(pid)
-
-                                    # Remove from pending list
-                                    if pid in parent_ids_pending:
-                                        parent_ids_pending.remove(pid)
-
-            # Last we check if parents pending previous chunks is in this chunk
-            ppending = set(parent_ids_pending)
-            if len(ppending) > 0:
-                logger.info(" --- Checking parent/child integrity --- ")
-                for pid in ppending:
-                    # Firs we check if the parent dataset are in our jobs
-                    myparent = None
-                    parent = [el for el in docs if el['id'] == pid]
-
-                    if len(parent) > 0:
-                        myparent = parent.pop()
-                        myparent_ = myparent
-                        logger.debug("pending parent found in current chunk: %s ", myparent['id'])
-                        parent_found = True
-                        if myparent['isParent'] is False:
-                            logger.debug('found unprocessed pending parent %s in this job.' % pid)
-                            logger.debug('updating parent')
-
-                            docs.remove(myparent)  # Remove original
-                            myparent_.update({'isParent': True})
-                            docs.append(myparent_)
-
-                            # Remove from pending list
-                            if pid in parent_ids_pending:
-                                parent_ids_pending.remove(pid)
-
-                            # add to processed list for reference
-                            parent_ids_processed.add(pid)
-
+                # Check if we got some children in the batch pointing to a parent id
+                parentids = {element for element in statuses if element is not None}
+                logger.debug(parentids)
+
+                # Check if the parent(s) of the children(s) was found before.
+                # If not, we add them to found.
+                parent_ids_found |= parentids
+                parent_ids_pending |= parentids - parent_ids_processed
+
+                # Check if the parent(s) of the children(s) we found was processed.
+                # If so, we do not process agian
+                parentids -= parent_ids_processed
+                parentids -= parent_ids_found
+
+                # Files processed so far
+                files_processed += len(files)
+
+                # Gnereate a list of documents to send to solr.
+                # Documents that could not be opened, parsed or converted to solr documents
+                # are skipped
+                docs_ = len(docs)  # Number of documents processed
+                # List of documents that can be indexed
+                docs = [el for el in docs if el is not None]
+                # Update # of skipped documents
+                docs_skipped += (docs_ - len(docs))
+
+                # keep track of all document ids we have indexed, so we do not have to check solr
+                # for a parent more than we need
+                docids_ = {doc['id'] for doc in docs}
+                doc_ids_processed.update(docids_)
+
+                # Do not index datasets that are already in the index, if requested.
+                # The index is checked for all the ids of the batch in one request.
+                if self.skip_existing:
+                    existing = get_existing_ids(docids_)
+                    if len(existing) > 0:
+                        logger.info("Skipping %d documents already in the index", len(existing))
+                        docs = [doc for doc in docs if doc['id'] not in existing]
+
+                # Position of each document in the list, so documents can be looked up
+                # and replaced by id without searching the list
+                by_id = {doc['id']: i for i, doc in enumerate(docs)}
+
+                """TODO: Add wms thumbnail batch creation here."""
+                if self.tflg is True:
+                    thumb_docs = [
+                        doc for doc in docs if 'data_access_url_ogc_wms' in doc]
+                    """######################## STARTING THREADS ########################
+                    # Load each file using multiple threads, and process documents
+                    # as files are loaded
+                    ###################################################################"""
+                    logger.info("---- Creating thumbnails concurrently %d ----", self.threads)
+                    if (isinstance(self.thumbClass, dict)):
+                        for (doc, newdoc) in multiprocess(fn=create_wms_thumbnail_api_wrapper,
+                                                          inputs=thumb_docs,
+                                                          max_concurrency=self.threads):
+                            docs[by_id[doc['id']]] = newdoc
+                    else:
+                        for (doc, newdoc) in multiprocess(fn=create_wms_thumbnail,
+                                                          inputs=thumb_docs,
+                                                          max_concurrency=self.threads):
+                            docs[by_id[doc['id']]] = newdoc
+                    """################################## THREADS FINISHED ##################"""
+                # Run over the list of parentids found in this chunk, and look for the parent.
+                # The parents that are not in this chunk, but was processed before,
+                # are looked up in the index in one request.
+                index_map = get_datasets(
+                    pid for pid in parentids if pid in doc_ids_processed and pid not in by_id)
+                for pid in parentids:
+                    logger.debug("checking parent: %s", pid)
+                    self._resolve_parent(pid, docs, by_id,
+                                         index_map if pid in doc_ids_processed else None,
+                                         parent_updates, parent_ids_pending, parent_ids_processed)
+
+                # Last we check if parents pending previous chunks is in this chunk.
+                # Iterate a snapshot, as resolved parents are removed from the pending set.
+                ppending = tuple(parent_ids_pending)
+                if len(ppending) > 0:
+                    logger.info(" --- Checking parent/child integrity --- ")
                     # If the parent was proccesd, asume it was indexed before flagged
-                    if pid in doc_ids_processed and not parent_found:
-                        myparent = get_dataset(pid)
-
-                        # If we did not find the parent in this job, check the index
-                        if myparent['doc'] is not None:
-                            logger.debug("pending parent found in index: %s, isParent: %s",
-                                         (myparent['doc']['id'], myparent['doc']['isParent']))
-
-                            if myparent['doc']['isParent'] is False:
-                                logger.debug('Update on indexed parent %s, isParent: True' % pid)
-                                mydoc_ = IndexMMD._solr_update_parent_doc(myparent['doc'])
-                                mydoc = mydoc_
-                                # doc = {'id': pid, 'isParent': True}
-                                try:
-                                    solr_add([mydoc])
-                                except Exception as e:
-                                    logger.error(
-                                        "Could not update parent on index. reason %s", e)
-
-                                # Update lists
-                                parent_ids_processed.add(pid)
-
-                                # Remove from pending list
-                                if pid in parent_ids_pending:
-                                    parent_ids_pending.remove(pid)
-
-            # TODO: Add posibility to not index datasets that are already in the index
-                # 1. Generate a list of doc ids from the docs to be indexed.
-                # 2. Search in solr for the ids
-                # 3. If the document was indexed
-                    # remove document from docs to be indexed
-
-            # Keep track of docs indexed and batch iteration
-            docs_indexed += len(docs)
-            it += 1
-            batch_run += 1
-
-            # Send processed documents to solr  for indexing as a new thread.
-            # max threads is set in config
-            logger.info("---- Indexing documents ----")
-            indexthread = threading.Thread(target=self.add2solr, name="Index thread %s" % (
-                len(self.indexthreads)+1), args=(docs, index_error_queue))
-            indexthread.start()
-            self.indexthreads.append(indexthread)
-            logger.debug("Starting thread: %s", indexthread.getName())
-            # indexthread.start()
-
-            # If we have reached maximum threads, we wait until finished
-            # if len(indexthreads) >= self.threads:
-            #     thr = indexthreads.pop(0)
-            #     thr.join()
-            # if len(indexthreads) >= self.threads:
-            #    for thr in indexthreads:
-            #        thr.join()
-
-        #   print("===================================")
-        #   print("Added %s documents to solr. Total: %s" % (len(docs),docs_indexed))
-        #   print("===================================")
-
-        """############### BATCH LOOP END  ############################"""
+                    index_map = get_datasets(
+                        pid for pid in ppending if pid in doc_ids_processed and pid not in by_id)
+                    for pid in ppending:
+                        self._resolve_parent(pid, docs, by_id,
+                                             index_map if pid in doc_ids_processed else None,
+                                             parent_updates, parent_ids_pending,
+                                             parent_ids_processed)
+
+                # Update the parents found in the index in one request
+                if len(parent_updates) > 0:
+                    try:
+                        solr_add(parent_updates)
+                    except Exception as e:
+                        logger.error("Could not update parents on index. reason %s", e)
+                    parent_updates.clear()
+
+                # Keep track of docs indexed and batch iteration
+                docs_indexed += len(docs)
+                it += 1
+                batch_run += 1
+
+                # Send processed documents to solr for indexing in the index thread pool.
+                # max threads is set in config. If all index threads are busy,
+                # we wait for one to finish before the next batch is read.
+                logger.info("---- Indexing documents ----")
+                index_slots.acquire()
+                future = index_pool.submit(self.add2solr, docs, index_error_queue)
+                future.add_done_callback(lambda f: index_slots.release())
+                index_futures.append(future)
+
+                files, results = next_files, next_results
+
+            #   print("===================================")
+            #   print("Added %s documents to solr. Total: %s" % (len(docs),docs_indexed))
+            #   print("===================================")
+
+        finally:
+            """############### BATCH LOOP END  ############################"""
+            # Stop the pools also when a batch failed, and
+            # wait for any index threads still running to complete
+            pool.shutdown()
+            Futures.wait(index_futures)
+            index_pool.shutdown()
+            while not index_error_queue.empty():
+                logger.error(index_error_queue.get())
 
         # Last we assume all pending parents are in the index
-        ppending = set(parent_ids_pending)
+        ppending = tuple(parent_ids_pending)
         if len(ppending) > 0:
             logger.info(" --- Checking parent/child integrity --- ")
             logger.debug(
                 "The last parents should be in index, or was processed by another worker.")
+            index_map = get_datasets(ppending)
             for pid in ppending:
+                self._resolve_parent(pid, [], {}, index_map,
+                                     parent_updates, parent_ids_pending, parent_ids_processed)
+            if len(parent_updates) > 0:
+                try:
+                    solr_add(parent_updates)
+                except Exception as e:
+                    logger.error("Could not update parents on index. reason %s", e)
+                parent_updates.clear()
 
-                myparent = None
-                myparent = get_dataset(pid)
-                if myparent['doc'] is not None:
-                    logger.debug("pending parent found in index: %s, isParent: %s",
-                                 myparent['doc']['id'], myparent['doc']['isParent'])
-
-                    if myparent['doc']['isParent'] is False:
-                        logger.debug('Update on indexed parent %s, isParent: True' % pid)
-                        mydoc_ = IndexMMD._solr_update_parent_doc(myparent['doc'])
-
-                        # doc = {'id': pid, 'isParent': True}
-                        try:
-                            solr_add([mydoc_])
-                        except Exception as e:
-                            logger.error("Could not update parent on index. reason %s", e)
-                            # Update lists
-                        parent_ids_processed.add(pid)
-
-                        # Remove from pending list
-                        if pid in parent_ids_pending:
-                            parent_ids_pending.remove(pid)
-        # wait for any threads still running to complete"""
-        for thr in self.indexthreads:
-            thr.join()
-
-        while not index_error_queue.empty():
-            logger.error(index_error_queue.get())
-
-        Futures.ALL_COMPLETED
         # Store the tracking information and return back to calling script
         parent_ids_found_ = parent_ids_found.copy()
         parent_ids_pending_ = parent_ids_pending.copy()
@@ -36,39 +36,221 @@ UPDATES:
 """
 
 
-import base64
+import time
+import binascii
+import functools
+import itertools
 import pysolr
-import netCDF4
 import logging
-import xmltodict
+import orjson
 import requests
-import dateutil.parser
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 # from dateutil.parser import ParserError
-import lxml.etree as ET
-
-import shapely.geometry as shpgeo
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from metvocab.mmdgroup import MMDGroup
-from shapely.geometry import box, mapping
 
-from solrindexer.tools import rewrap, process_feature_type
-from solrindexer.tools import to_solr_id, parse_date
+from solrindexer.tools import rewrap, process_feature_type, VALID_FEATURE_TYPES
+from solrindexer.tools import to_solr_id, parse_date, parse_datetime, solr_add
+from solrindexer.tools import solr_delete
+from solrindexer.multithread.io import parse_mmd, mmd_xml_filename, MMD_JSON_SUFFIX
 from solrindexer.thumb.thumbnail_api import create_wms_thumbnail_api
 
 logger = logging.getLogger(__name__)
 
+# Required mmd elements. Empty ones are set to Unknown in check_mmd
+MMD_REQUIREMENTS = (
+    'mmd:metadata_version',
+    'mmd:metadata_identifier',
+    'mmd:title',
+    'mmd:abstract',
+    'mmd:metadata_status',
+    'mmd:dataset_production_status',
+    'mmd:collection',
+    'mmd:last_metadata_update',
+    'mmd:iso_topic_category',
+    'mmd:keywords',
+)
+
+# Controlled vocabulary for the mmd elements checked in check_mmd
+MMD_CONTROLLED_ELEMENTS = {
+    'mmd:iso_topic_category': 'https://vocab.met.no/mmd/ISO_Topic_Category',
+    'mmd:collection': 'https://vocab.met.no/mmd/Collection_Keywords',
+    'mmd:dataset_production_status': 'https://vocab.met.no/mmd/Dataset_Production_Status',
+    'mmd:quality_control': 'https://vocab.met.no/mmd/Quality_Control',
+}
+
+# Look Up Tables for tosolr
+PERSONNEL_ROLE_LUT = {'Investigator': 'investigator',
+                      'Technical contact': 'technical',
+                      'Metadata author': 'metadata_author',
+                      'Data center contact': 'datacenter'
+                      }
+# Fields SolR generates for a document, which must be removed before it is added again
+PARENT_STRIP_FIELDS = frozenset(('full_text', 'bbox__maxX', 'bbox__maxY', 'bbox__minX',
+                                 'bbox__minY', 'bbox_rpt', 'ss_access', '_version_'))
+
+# Size of the IndexMMD dataset cache, and the number of seconds a dataset is kept
+DATASET_CACHE_SIZE = 4096
+DATASET_CACHE_TTL = 60
+
+# Storage information elements indexed as strings
+STORAGE_INFORMATION_FIELDS = (
+    ('mmd:file_name', 'storage_information_file_name'),
+    ('mmd:file_location', 'storage_information_file_location'),
+    ('mmd:file_format', 'storage_information_file_format'),
+)
+# Keyword vocabularies that are also indexed in their own field for faceting
+KEYWORD_VOCABULARY_FIELDS = {'GCMDSK': 'keywords_gcmd',
+                             'WIGOS': 'keywords_wigos',
+                             'GCMDLOC': 'keywords_gcmdloc',
+                             'GCMDPROV': 'keywords_gcmdprov',
+                             'CFSTDN': 'keywords_cfstdn',
+                             'GEMET': 'keywords_gemet',
+                             'NORTHEMES': 'keywords_northemes',
+                             }
+RELATED_INFORMATION_LUT = {'Dataset landing page': 'landing_page',
+                           'Users guide': 'user_guide',
+                           'Project home page': 'home_page',
+                           'Observation facility': 'obs_facility',
+                           'Extended metadata': 'ext_metadata',
+                           'Scientific publication': 'scientific_publication',
+                           'Data paper': 'data_paper',
+                           'Data management plan': 'data_management_plan',
+                           'Other documentation': 'other_documentation',
+                           'Software': 'software',
+                           }
+
+# Role based personnel fields, which are all initialized as empty lists.
+# don't think address_address is needed Øystein Godøy, METNO/FOU, 2021-09-08
+PERSONNEL_FIELDS = ('role', 'name', 'email', 'phone', 'fax', 'organisation', 'address',
+                    'address_city', 'address_province_or_state', 'address_postal_code',
+                    'address_country')
+# Solr field names for each mmd personnel role, e.g.
+# PERSONNEL_FIELD_KEYS['Investigator']['email'] == 'personnel_investigator_email'
+PERSONNEL_FIELD_KEYS = {
+    role: {field: f'personnel_{short}_{field}' for field in PERSONNEL_FIELDS}
+    for role, short in PERSONNEL_ROLE_LUT.items()
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _mmd_group(uri):
+    """Vocabulary group for the uri, created once per process"""
+    return MMDGroup('mmd', uri)
+
+
+@functools.lru_cache(maxsize=8192)
+def _vocab_search(uri, value):
+    """Search the vocabulary for the value. Only a few distinct values
+    are used across a collection of files, so the result is cached."""
+    return _mmd_group(uri).search(value)
+
+
+@functools.lru_cache(maxsize=1024)
+def _local(name):
+    """Element name without the namespace prefix, e.g. mmd:title -> title"""
+    return name.rpartition(':')[2]
+
+
+def _append_elements(target, prefix, element, qualify=False):
+    """Append the value of each sub element to the list target[prefix_<name>].
+    Sub elements with children are flattened one level. Their children are
+    named prefix_<child>, or prefix_<name>_<child> if qualify is set."""
+    for key, value in element.items():
+        if isinstance(value, dict):
+            sub_prefix = f'{prefix}_{_local(key)}' if qualify else prefix
+            for sub_key, sub_value in value.items():
+                target.setdefault(f'{sub_prefix}_{_local(sub_key)}', []).append(sub_value)
+        else:
+            target.setdefault(f'{prefix}_{_local(key)}', []).append(value)
+
+
+def _wkt_num(value):
+    """Format a coordinate the way shapely writes it in WKT"""
+    # Adding 0.0 turns -0.0 into 0.0, which shapely writes as 0
+    text = repr(float(value) + 0.0).replace('e-0', 'e-')
+    return text[:-2] if text.endswith('.0') else text
+
+
+def _point_wkt(x, y):
+    """WKT for a point"""
+    return f'POINT ({_wkt_num(x)} {_wkt_num(y)})'
+
+
+def _box_wkt(west, south, east, north, ccw=True):
+    """WKT for a bounding box, with the same vertex order as shapely.geometry.box"""
+    w, s, e, n = _wkt_num(west), _wkt_num(south), _wkt_num(east), _wkt_num(north)
+    if ccw:
+        return f'POLYGON (({e} {s}, {e} {n}, {w} {n}, {w} {s}, {e} {s}))'
+    return f'POLYGON (({w} {s}, {w} {n}, {e} {n}, {e} {s}, {w} {s}))'
+
+
+def _bbox_error(north, south, east, west):
+    """Check a bounding box. Returns the log message and the error for the
+    first problem found, or None if the bounding box is valid."""
+    if not north >= south:
+        return ('Northernmost boundary is south of southernmost, will not process...',
+                'Error in spatial bounds')
+    if not east >= west:
+        return ('Easternmost boundary is west of westernmost, will not process...',
+                'Error in spatial bounds')
+    # With the order checked above, only the outer bounds can be out of range
+    if east > 180 or west < -180:
+        return ('Longitudes outside valid range, will not process...',
+                'Error in longitude bounds')
+    if north > 90 or south < -90:
+        return ('Latitudes outside valid range, will not process...',
+                'Error in latitude bounds')
+    return None
+
+
+def _as_list(node):
+    """A repeated element is parsed to a list, a single one is not.
+    Returns the element(s) as a list."""
+    return node if isinstance(node, list) else [node]
+
+
+def _text(node):
+    """Text of an element, which is a dict if the element has attributes"""
+    return node['#text'] if isinstance(node, dict) else node
+
+
+def _pick_lang(node, lang='en'):
+    """Text of the last element with the given language, or None.
+    An element without attributes is returned as a string."""
+    if not isinstance(node, (list, dict)):
+        return str(node)
+    text = None
+    for e in (node if isinstance(node, list) else (node,)):
+        if isinstance(e, dict) and e.get('@xml:lang', e.get('@lang')) == lang:
+            text = e['#text']
+    return text
+
 
 class MMD4SolR:
     """ Read and check MMD files, convert to dictionary """
 
-    def __init__(self, filename=None, mydoc=None, bulkFile=None):
-        logger.debug('Creating an instance of MMD4SolR')
+    # Many instances are created when bulk indexing, so no instance dict is kept
+    __slots__ = ('filename', 'mydoc', 'parent', 'xml_bytes')
+
+    def __init__(self, filename=None, mydoc=None, bulkFile=None, xml_bytes=None):
         self.filename = filename
-        logger.debug("filename is %s. mydoc is %s", filename, type(mydoc))
+        # The raw mmd xml, embedded base64 encoded in the solr document
+        self.xml_bytes = xml_bytes
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Creating an instance of MMD4SolR')
+            logger.debug("filename is %s. mydoc is %s", filename, type(mydoc))
         if filename is not None:
             try:
-                with open(self.filename, encoding='utf-8') as fd:
-                    self.mydoc = xmltodict.parse(fd.read())
+                with open(self.filename, 'rb') as fd:
+                    data = fd.read()
+                self.mydoc = parse_mmd(data, self.filename)
+                if not str(self.filename).endswith(MMD_JSON_SUFFIX):
+                    self.xml_bytes = data
             except Exception as e:
                 logger.error('Could not open file: %s.\n Reason: %s', self.filename, e)
                 raise
@@ -90,61 +272,33 @@ class MMD4SolR:
         in the Arctic context.
         """
         # TODO add proper docstring
-        mmd_requirements = {
-            'mmd:metadata_version': False,
-            'mmd:metadata_identifier': False,
-            'mmd:title': False,
-            'mmd:abstract': False,
-            'mmd:metadata_status': False,
-            'mmd:dataset_production_status': False,
-            'mmd:collection': False,
-            'mmd:last_metadata_update': False,
-            'mmd:iso_topic_category': False,
-            'mmd:keywords': False,
-        }
         """
         Check for presence and non empty elements
         This must be further developed...
         """
         mmd = self.mydoc['mmd:mmd']
-        for requirement in mmd_requirements.keys():
-            if requirement in mmd:
-                logger.debug('Checking for: %s', requirement)
-                if requirement in mmd:
-                    if mmd[requirement] is not None:
-                        logger.debug('%s is present and non empty', requirement)
-                        mmd_requirements[requirement] = True
-                    else:
-                        logger.warning('Required element %s is missing, setting it to unknown',
-                                       requirement)
-                        mmd[requirement] = 'Unknown'
-                else:
-                    logger.warning('Required element %s is missing, setting it to unknown.',
-                                   requirement)
-                    mmd[requirement] = 'Unknown'
+        # Checked once, for the debug logs inside the loops below
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for requirement in MMD_REQUIREMENTS:
+            if requirement not in mmd:
+                continue
+            if mmd[requirement] is not None:
+                if debug:
+                    logger.debug('%s is present and non empty', requirement)
+            else:
+                logger.warning('Required element %s is missing, setting it to unknown',
+                               requirement)
+                mmd[requirement] = 'Unknown'
 
         logger.debug("Checking controlled vocabularies")
         # Should be collected from
         #    https://github.com/steingod/scivocab/tree/master/metno
         #  Is fetched from vocab.met.no via https://github.com/metno/met-vocab-tools
 
-        mmd_iso_topic_category = MMDGroup(
-            'mmd', 'https://vocab.met.no/mmd/ISO_Topic_Category')
-        mmd_collection = MMDGroup(
-            'mmd', 'https://vocab.met.no/mmd/Collection_Keywords')
-        mmd_dataset_status = MMDGroup(
-            'mmd', 'https://vocab.met.no/mmd/Dataset_Production_Status')
-        mmd_quality_control = MMDGroup(
-            'mmd', 'https://vocab.met.no/mmd/Quality_Control')
-        mmd_controlled_elements = {
-            'mmd:iso_topic_category': mmd_iso_topic_category,
-            'mmd:collection': mmd_collection,
-            'mmd:dataset_production_status': mmd_dataset_status,
-            'mmd:quality_control': mmd_quality_control,
-        }
-        for element in mmd_controlled_elements.keys():
-            logger.debug(
-                'Checking %s for compliance with controlled vocabulary', element)
+        for element, vocab in MMD_CONTROLLED_ELEMENTS.items():
+            if debug:
+                logger.debug(
+                    'Checking %s for compliance with controlled vocabulary', element)
             if element in mmd:
                 if isinstance(mmd[element], list):
                     for elem in mmd[element]:
@@ -159,7 +313,7 @@ class MMD4SolR:
                         myvalue = mmd.get('element', None)
 
                 if myvalue is not None:
-                    if mmd_controlled_elements[element].search(myvalue) is False:
+                    if _vocab_search(vocab, myvalue) is False:
                         logger.warning(
                             '%s contains non valid content: %s', element, myvalue)
 
@@ -167,18 +321,10 @@ class MMD4SolR:
         Check that keywords also contain GCMD keywords
         Need to check contents more specifically...
         """
-        gcmd = False
         logger.debug("Checking for gmcd keywords")
-        if isinstance(mmd['mmd:keywords'], list):
-            for elem in mmd['mmd:keywords']:
-                if str(elem['@vocabulary']).upper() == 'GCMDSK':
-                    gcmd = True
-                    break
-            if not gcmd:
-                logger.warning('Keywords in GCMD are not available (a)')
-        else:
-            if str(mmd['mmd:keywords']['@vocabulary']).upper() != 'GCMDSK':
-                logger.warning('Keywords in GCMD are not available (b)')
+        if not any(elem['@vocabulary'].casefold() == 'gcmdsk'
+                   for elem in _as_list(mmd['mmd:keywords'])):
+            logger.warning('Keywords in GCMD are not available')
 
         """
         Modify dates if necessary
@@ -231,7 +377,7 @@ class MMD4SolR:
                             item[mykey] = mydate
                         else:
                             try:
-                                mydate = dateutil.parser.parse(str(item[mykey]))
+                                mydate = parse_datetime(str(item[mykey]))
                                 item[mykey] = mydate.strftime('%Y-%m-%dT%H:%M:%SZ')
                             except Exception as e:
                                 logger.error(
@@ -249,7 +395,7 @@ class MMD4SolR:
                         mmd['mmd:temporal_extent'][mykey].set(mydate)
                     else:
                         try:
-                            mydate = dateutil.parser.parse(str(myitem))
+                            mydate = parse_datetime(str(myitem))
                             mmd['mmd:temporal_extent'][mykey] = \
                                 mydate.strftime('%Y-%m-%dT%H:%M:%SZ')
                         except Exception as e:
@@ -262,24 +408,6 @@ class MMD4SolR:
         to the XSD.
         """
 
-        # Defining Look Up Tables
-        personnel_role_LUT = {'Investigator': 'investigator',
-                              'Technical contact': 'technical',
-                              'Metadata author': 'metadata_author',
-                              'Data center contact': 'datacenter'
-                              }
-        related_information_LUT = {'Dataset landing page': 'landing_page',
-                                   'Users guide': 'user_guide',
-                                   'Project home page': 'home_page',
-                                   'Observation facility': 'obs_facility',
-                                   'Extended metadata': 'ext_metadata',
-                                   'Scientific publication': 'scientific_publication',
-                                   'Data paper': 'data_paper',
-                                   'Data management plan': 'data_management_plan',
-                                   'Other documentation': 'other_documentation',
-                                   'Software': 'software',
-                                   }
-
         # As of python 3.6 Dictionaries are ordered by insertion (as OrderedDict)
         mydict = {}
 
@@ -291,17 +419,9 @@ class MMD4SolR:
         # the correct one.
 
         logger.debug("Identifier and metadata_identifier")
-        if isinstance(mmd['mmd:metadata_identifier'], dict):
-            myid = mmd['mmd:metadata_identifier']['#text']
-            myid = to_solr_id(myid)
-            mydict['id'] = myid
-            mydict['metadata_identifier'] = \
-                mmd['mmd:metadata_identifier']['#text']
-        else:
-            myid = mmd['mmd:metadata_identifier']
-            myid = to_solr_id(myid)
-            mydict['id'] = myid
-            mydict['metadata_identifier'] = mmd['mmd:metadata_identifier']
+        metadata_identifier = _text(mmd['mmd:metadata_identifier'])
+        mydict['id'] = to_solr_id(metadata_identifier)
+        mydict['metadata_identifier'] = metadata_identifier
         logger.debug("Got metadata_identifier: %s", mydict['metadata_identifier'])
         logger.debug("Last metadata update")
         if 'mmd:last_metadata_update' in mmd:
@@ -311,18 +431,17 @@ class MMD4SolR:
             lmu_note = []
             # FIXME check if this works correctly
             # Only one last_metadata_update element
-            if isinstance(last_metadata_update['mmd:update'], dict):
-                lmu_datetime.append(
-                    str(last_metadata_update['mmd:update']['mmd:datetime']))
-                lmu_type.append(last_metadata_update['mmd:update']['mmd:type'])
-                lmu_note.append(
-                    last_metadata_update['mmd:update'].get('mmd:note', ''))
+            updates = last_metadata_update['mmd:update']
+            if isinstance(updates, dict):
+                lmu_datetime.append(str(updates['mmd:datetime']))
+                lmu_type.append(updates['mmd:type'])
+                lmu_note.append(updates.get('mmd:note', ''))
             # Multiple last_metadata_update elements
             else:
-                for i, e in enumerate(last_metadata_update['mmd:update']):
+                for e in updates:
                     lmu_datetime.append(str(e['mmd:datetime']))
                     lmu_type.append(e['mmd:type'])
-                    if 'mmd:note' in e.keys():
+                    if 'mmd:note' in e:
                         lmu_note.append(e['mmd:note'])
                     else:
                         lmu_note.append('Not provided')
@@ -337,72 +456,35 @@ class MMD4SolR:
             mydict['last_metadata_update_note'] = lmu_note
 
         logger.debug("Metadata status")
-        if isinstance(mmd['mmd:metadata_status'], dict):
-            mydict['metadata_status'] = mmd['mmd:metadata_status']['#text']
-        else:
-            mydict['metadata_status'] = mmd['mmd:metadata_status']
+        mydict['metadata_status'] = _text(mmd['mmd:metadata_status'])
 
         logger.debug("Collection")
         if 'mmd:collection' in mmd:
-            mydict['collection'] = []
             if isinstance(mmd['mmd:collection'], list):
-                for e in mmd['mmd:collection']:
-                    if isinstance(e, dict):
-                        mydict['collection'].append(e['#text'])
-                    else:
-                        mydict['collection'].append(e)
+                mydict['collection'] = [_text(e) for e in mmd['mmd:collection']]
             else:
                 mydict['collection'] = mmd['mmd:collection']
 
         logger.debug("Title")
-        if isinstance(mmd['mmd:title'], list):
-            for e in mmd['mmd:title']:
-                if '@xml:lang' in e:
-                    if e['@xml:lang'] == 'en':
-                        mydict['title'] = e['#text']
-                elif '@lang' in e:
-                    if e['@lang'] == 'en':
-                        mydict['title'] = e['#text']
-        else:
-            if isinstance(mmd['mmd:title'], dict):
-                if '@xml:lang' in mmd['mmd:title']:
-                    if mmd['mmd:title']['@xml:lang'] == 'en':
-                        mydict['title'] = mmd['mmd:title']['#text']
-                if '@lang' in mmd['mmd:title']:
-                    if mmd['mmd:title']['@lang'] == 'en':
-                        mydict['title'] = mmd['mmd:title']['#text']
-            else:
-                mydict['title'] = str(mmd['mmd:title'])
+        title = _pick_lang(mmd['mmd:title'])
+        if title is not None:
+            mydict['title'] = title
 
         logger.debug("Abstract")
-        if isinstance(mmd['mmd:abstract'], list):
-            for e in mmd['mmd:abstract']:
-                if '@xml:lang' in e:
-                    if e['@xml:lang'] == 'en':
-                        mydict['abstract'] = e['#text']
-                elif '@lang' in e:
-                    if e['@lang'] == 'en':
-                        mydict['abstract'] = e['#text']
-        else:
-            if isinstance(mmd['mmd:abstract'], dict):
-                if '@xml:lang' in mmd['mmd:abstract']:
-                    if mmd['mmd:abstract']['@xml:lang'] == 'en':
-                        mydict['abstract'] = mmd['mmd:abstract']['#text']
-                if '@lang' in mmd['mmd:abstract']:
-                    if mmd['mmd:abstract']['@lang'] == 'en':
-                        mydict['abstract'] = mmd['mmd:abstract']['#text']
-            else:
-                mydict['abstract'] = str(mmd['mmd:abstract'])
+        abstract = _pick_lang(mmd['mmd:abstract'])
+        if abstract is not None:
+            mydict['abstract'] = abstract
 
         logger.debug("Temporal extent")
         if 'mmd:temporal_extent' in mmd:
-            if isinstance(mmd['mmd:temporal_extent'], list):
-                maxtime = dateutil.parser.parse('1000-01-01T00:00:00Z')
-                mintime = dateutil.parser.parse('2099-01-01T00:00:00Z')
-                for item in mmd['mmd:temporal_extent']:
+            temporal_extent = mmd['mmd:temporal_extent']
+            if isinstance(temporal_extent, list):
+                maxtime = parse_datetime('1000-01-01T00:00:00Z')
+                mintime = parse_datetime('2099-01-01T00:00:00Z')
+                for item in temporal_extent:
                     for myval in item.values():
                         if myval != '':
-                            mytime = dateutil.parser.parse(myval)
+                            mytime = parse_datetime(myval)
                         if mytime < mintime:
                             mintime = mytime
                         if mytime > maxtime:
@@ -412,12 +494,9 @@ class MMD4SolR:
                 mydict['temporal_extent_end_date'] = maxtime.strftime(
                     '%Y-%m-%dT%H:%M:%SZ')
             else:
-                mydict["temporal_extent_start_date"] = str(
-                    mmd['mmd:temporal_extent']['mmd:start_date'])
-                if 'mmd:end_date' in mmd['mmd:temporal_extent']:
-                    if mmd['mmd:temporal_extent']['mmd:end_date'] is not None:
-                        mydict["temporal_extent_end_date"] = str(
-                            mmd['mmd:temporal_extent']['mmd:end_date'])
+                mydict["temporal_extent_start_date"] = str(temporal_extent['mmd:start_date'])
+                if temporal_extent.get('mmd:end_date') is not None:
+                    mydict["temporal_extent_end_date"] = str(temporal_extent['mmd:end_date'])
 
             if "temporal_extent_end_date" in mydict:
                 logger.debug('Creating daterange with end date')
@@ -452,8 +531,8 @@ class MMD4SolR:
                         lonvals.append(float(e['mmd:rectangle']['mmd:west']))
 
                 if len(latvals) > 0 and len(lonvals) > 0:
-                    mydict['geographic_extent_rectangle_north'] = max(latvals)
-                    mydict['geographic_extent_rectangle_south'] = min(latvals)
+                    north = max(latvals)
+                    south = min(latvals)
 
                     # Test for numbers < -180 and > 180, and fix.
                     minlon = min(lonvals)
@@ -462,29 +541,28 @@ class MMD4SolR:
                     maxlon = max(lonvals)
                     if maxlon > 180.0:
                         maxlon = rewrap(maxlon)
-                    lonvals.clear()
-                    lonvals.append(minlon)
-                    lonvals.append(maxlon)
+                    # The rewrapped values may have swapped order
+                    west = min(minlon, maxlon)
+                    east = max(minlon, maxlon)
 
-                    mydict['geographic_extent_rectangle_west'] = min(lonvals)
-                    mydict['geographic_extent_rectangle_east'] = max(lonvals)
-                    mydict['bbox'] = "ENVELOPE("+str(min(lonvals))+","+str(max(lonvals))+"," +\
-                        str(max(latvals))+","+str(min(latvals))+")"
+                    mydict['geographic_extent_rectangle_north'] = north
+                    mydict['geographic_extent_rectangle_south'] = south
+                    mydict['geographic_extent_rectangle_west'] = west
+                    mydict['geographic_extent_rectangle_east'] = east
+                    mydict['bbox'] = f"ENVELOPE({west},{east},{north},{south})"
 
                     # Check if we have a point or a boundingbox
-                    if max(latvals) == min(latvals):
-                        if max(lonvals) == min(lonvals):
-                            point = shpgeo.Point(float(e['mmd:rectangle']['mmd:east']),
-                                                 float(e['mmd:rectangle']['mmd:north']))
-                            mydict['polygon_rpt'] = point.wkt
+                    if north == south:
+                        if east == west:
+                            point = _point_wkt(float(e['mmd:rectangle']['mmd:east']),
+                                               float(e['mmd:rectangle']['mmd:north']))
+                            mydict['polygon_rpt'] = point
                             mydict['geospatial_bounds'] = mydict['bbox']
-                            logger.debug(mapping(point))
+                            logger.debug(point)
                     else:
-                        bbox = box(min(lonvals), min(latvals),
-                                   max(lonvals), max(latvals))
+                        polygon = _box_wkt(west, south, east, north)
                         logger.debug("First conditition")
-                        logger.debug(bbox)
-                        polygon = bbox.wkt
+                        logger.debug(polygon)
                         mydict['polygon_rpt'] = polygon
                         if not mydict['bbox'] == "ENVELOPE(-180.0,180.0,90,-90)":
                             mydict['geospatial_bounds'] = mydict['bbox']
@@ -497,34 +575,18 @@ class MMD4SolR:
             else:
                 # logger.debug(type(mmd_geographic_extent['mmd:rectangle']))
                 # logger.debug(mmd_geographic_extent['mmd:rectangle'])
-                for item in mmd_geographic_extent['mmd:rectangle']:
+                rectangle = mmd_geographic_extent['mmd:rectangle']
+                for item in rectangle:
                     if item is None:
                         logger.warning(
                             'Missing geographical element, will not process the file.')
                         mydict['metadata_status'] = 'Inactive'
                         raise Warning('Missing spatial bounds')
 
-                # Test for numbers < -180 and > 180, and fix.
-                minlon = float(
-                    self.mydoc['mmd:mmd']['mmd:geographic_extent']['mmd:rectangle']['mmd:west'])
-                if minlon < -180.0:
-                    minlon = rewrap(minlon)
-                maxlon = float(
-                    self.mydoc['mmd:mmd']['mmd:geographic_extent']['mmd:rectangle']['mmd:east'])
-                if maxlon > 180.0:
-                    maxlon = rewrap(maxlon)
-                lonvals = []
-                lonvals.append(minlon)
-                lonvals.append(maxlon)
-
-                north = float(
-                    mmd_geographic_extent['mmd:rectangle']['mmd:north'])
-                south = float(
-                    mmd_geographic_extent['mmd:rectangle']['mmd:south'])
-                east = float(
-                    mmd_geographic_extent['mmd:rectangle']['mmd:east'])
-                west = float(
-                    mmd_geographic_extent['mmd:rectangle']['mmd:west'])
+                north = float(rectangle['mmd:north'])
+                south = float(rectangle['mmd:south'])
+                east = float(rectangle['mmd:east'])
+                west = float(rectangle['mmd:west'])
                 mydict['geographic_extent_rectangle_north'] = north
                 mydict['geographic_extent_rectangle_south'] = south
                 mydict['geographic_extent_rectangle_east'] = east
@@ -533,47 +595,29 @@ class MMD4SolR:
                 """
                 Check if bounding box is correct
                 """
-                if not mydict['geographic_extent_rectangle_north'] >= south:
-                    logger.warning(
-                        'Northernmost boundary is south of southernmost, will not process...')
-                    mydict['metadata_status'] = 'Inactive'
-                    raise Warning('Error in spatial bounds')
-                if not mydict['geographic_extent_rectangle_east'] >= west:
-                    logger.warning(
-                        'Easternmost boundary is west of westernmost, will not process...')
-                    mydict['metadata_status'] = 'Inactive'
-                    raise Warning('Error in spatial bounds')
-                if (east > 180 or west > 180 or east < -180 or west < -180):
-                    logger.warning(
-                        'Longitudes outside valid range, will not process...')
+                error = _bbox_error(north, south, east, west)
+                if error is not None:
+                    logger.warning(error[0])
                     mydict['metadata_status'] = 'Inactive'
-                    raise Warning('Error in longitude bounds')
-                if (north > 90 or south > 90 or north < -90 or south < -90):
-                    logger.warning(
-                        'Latitudes outside valid range, will not process...')
-                    mydict['metadata_status'] = 'Inactive'
-                    raise Warning('Error in latitude bounds')
+                    raise Warning(error[1])
 
-                srsname = mmd_geographic_extent['mmd:rectangle'].get(
-                    '@srsName', None)
+                srsname = rectangle.get('@srsName', None)
                 if srsname is not None:
                     mydict['geographic_extent_rectangle_srsName'] = srsname
 
-                mydict['bbox'] = "ENVELOPE(" + str(west) + "," + \
-                    str(east) + "," + str(north) + "," + str(south) + ")"
+                mydict['bbox'] = f"ENVELOPE({west},{east},{north},{south})"
 
                 logger.debug("Second conditition")
                 #  Check if we have a point or a boundingbox
                 if south == north:
                     if east == west:
-                        point = shpgeo.Point(east, north)
-                        mydict['polygon_rpt'] = point.wkt
-                        mydict['geospatial_bounds'] = point.wkt
-                        logger.debug(mapping(point))
+                        point = _point_wkt(east, north)
+                        mydict['polygon_rpt'] = point
+                        mydict['geospatial_bounds'] = point
+                        logger.debug(point)
 
                 else:
-                    bbox = box(west, south, east, north, ccw=False)
-                    polygon = bbox.wkt
+                    polygon = _box_wkt(west, south, east, north, ccw=False)
                     logger.debug(polygon)
                     mydict['polygon_rpt'] = polygon
                     if not mydict['bbox'] == "ENVELOPE(-180.0,180.0,90,-90)":
@@ -613,48 +657,24 @@ class MMD4SolR:
                     'Both license identifier and resource needed to index properly')
                 mydict['use_constraint_identifier'] = "Not provided"
                 mydict['use_constraint_resource'] = "Not provided"
-            if 'mmd:license_text' in mmd['mmd:use_constraint']:
+            if 'mmd:license_text' in use_constraint:
                 mydict['use_constraint_license_text'] = str(
                     use_constraint['mmd:license_text'])
 
         logger.debug("Personnel")
-        if 'mmd:personnel' in self.mydoc['mmd:mmd']:
-            personnel_elements = self.mydoc['mmd:mmd']['mmd:personnel']
-
-            if isinstance(personnel_elements, dict):  # Only one element
-                # make it an iterable list
-                personnel_elements = [personnel_elements]
+        if 'mmd:personnel' in mmd:
+            personnel_elements = _as_list(mmd['mmd:personnel'])
 
             # Facet elements
-            mydict['personnel_role'] = []
-            mydict['personnel_name'] = []
-            mydict['personnel_organisation'] = []
-            # Fix role based lists
-            for role in personnel_role_LUT:
-                mydict['personnel_{}_role'.format(
-                    personnel_role_LUT[role])] = []
-                mydict['personnel_{}_name'.format(
-                    personnel_role_LUT[role])] = []
-                mydict['personnel_{}_email'.format(
-                    personnel_role_LUT[role])] = []
-                mydict['personnel_{}_phone'.format(
-                    personnel_role_LUT[role])] = []
-                mydict['personnel_{}_fax'.format(
-                    personnel_role_LUT[role])] = []
-                mydict['personnel_{}_organisation'.format(
-                    personnel_role_LUT[role])] = []
-                mydict['personnel_{}_address'.format(
-                    personnel_role_LUT[role])] = []
-                # don't think this is needed Øystein Godøy, METNO/FOU, 2021-09-08
-                # mydict['personnel_{}_address_address'.format(personnel_role_LUT[role])] = []
-                mydict['personnel_{}_address_city'
-                       .format(personnel_role_LUT[role])] = []
-                mydict['personnel_{}_address_province_or_state'
-                       .format(personnel_role_LUT[role])] = []
-                mydict['personnel_{}_address_postal_code'
-                       .format(personnel_role_LUT[role])] = []
-                mydict['personnel_{}_address_country'
-                       .format(personnel_role_LUT[role])] = []
+            role_list = mydict['personnel_role'] = []
+            name_list = mydict['personnel_name'] = []
+            organisation_list = mydict['personnel_organisation'] = []
+            # Fix role based lists, keeping a reference to each list by role and field
+            role_lists = {}
+            for role, keys in PERSONNEL_FIELD_KEYS.items():
+                role_lists[role] = {}
+                for field, key in keys.items():
+                    role_lists[role][field] = mydict[key] = []
 
             # Fill lists with information
             for personnel in personnel_elements:
@@ -662,83 +682,45 @@ class MMD4SolR:
                 if not role:
                     logger.warning('No role available for personnel')
                     break
-                if role not in personnel_role_LUT:
+                if role not in PERSONNEL_ROLE_LUT:
                     logger.warning('Wrong role provided for personnel')
                     break
-                for entry in personnel:
-                    entry_type = entry.split(':')[-1]
+                lists = role_lists[role]
+                for entry, value in personnel.items():
+                    entry_type = _local(entry)
                     if entry_type == 'role':
-                        mydict['personnel_{}_role'.format(personnel_role_LUT[role])] \
-                            .append(personnel[entry])
-                        mydict['personnel_role'].append(personnel[entry])
+                        lists['role'].append(value)
+                        role_list.append(value)
                     else:
                         # Treat address specifically and handle faceting elements
                         # personnel_role, personnel_name, personnel_organisation.
                         if entry_type == 'contact_address':
-                            for el in personnel[entry]:
-                                el_type = el.split(':')[-1]
+                            for el, el_value in value.items():
+                                el_type = _local(el)
                                 if el_type == 'address':
-                                    mydict['personnel_{}_{}'.
-                                           format(personnel_role_LUT[role], el_type)] \
-                                        .append(personnel[entry][el])
+                                    lists['address'].append(el_value)
                                 else:
-                                    mydict['personnel_{}_address_{}'
-                                           .format(personnel_role_LUT[role], el_type)] \
-                                        .append(personnel[entry][el])
+                                    lists['address_' + el_type].append(el_value)
                         elif entry_type == 'name':
-                            mydict['personnel_{}_{}'.
-                                   format(personnel_role_LUT[role], entry_type)] \
-                                .append(personnel[entry])
-                            mydict['personnel_name'].append(personnel[entry])
+                            lists['name'].append(value)
+                            name_list.append(value)
                         elif entry_type == 'organisation':
-                            mydict['personnel_{}_{}'.
-                                   format(personnel_role_LUT[role], entry_type)] \
-                                .append(personnel[entry])
-                            mydict['personnel_organisation'].append(
-                                personnel[entry])
+                            lists['organisation'].append(value)
+                            organisation_list.append(value)
                         else:
-                            mydict['personnel_{}_{}'.
-                                   format(personnel_role_LUT[role], entry_type)] \
-                                .append(personnel[entry])
+                            lists[entry_type].append(value)
 
         logger.debug("Data center")
         if 'mmd:data_center' in mmd:
-            data_center_elements = mmd['mmd:data_center']
-            # Only one element
-            if isinstance(data_center_elements, dict):
-                # make it an iterable list
-                data_center_elements = [data_center_elements]
+            data_center_elements = _as_list(mmd['mmd:data_center'])
 
             for data_center in data_center_elements:
-                for key, value in data_center.items():
-                    # if sub element is ordered dict
-                    if isinstance(value, dict):
-                        for key, val in value.items():
-                            element_name = f'data_center_{key.split(":")[-1]}'
-                            # create key in mydict
-                            if element_name not in mydict.keys():
-                                mydict[element_name] = []
-                                mydict[element_name].append(val)
-                            else:
-                                mydict[element_name].append(val)
-                    # sub element is not ordered dicts
-                    else:
-                        element_name = f'data_center_{key.split(":")[-1]}'
-                        # create key in mydict. Repetition of above. Should be simplified.
-                        if element_name not in mydict.keys():
-                            mydict[element_name] = []
-                            mydict[element_name].append(value)
-                        else:
-                            mydict[element_name].append(value)
+                _append_elements(mydict, 'data_center', data_center)
 
         logger.debug("Data access")
         # NOTE: This is identical to method above. Should in be simplified as method
         if 'mmd:data_access' in mmd:
-            data_access_elements = mmd['mmd:data_access']
-            # Only one element
-            if isinstance(data_access_elements, dict):
-                # make it an iterable list
-                data_access_elements = [data_access_elements]
+            data_access_elements = _as_list(mmd['mmd:data_access'])
             # iterate over all data_center elements
             for data_access in data_access_elements:
                 data_access_type = data_access['mmd:type'].replace(
@@ -746,18 +728,13 @@ class MMD4SolR:
                 mydict[f'data_access_url_{data_access_type}'] = data_access['mmd:resource']
 
                 if 'mmd:wms_layers' in data_access and data_access_type == 'ogc_wms':
-                    data_access_wms_layers_string = 'data_access_wms_layers'
-                    # Map directly to list
-                    data_access_wms_layers = None
+                    # Map directly to list. The parsed list is not used elsewhere,
+                    # so it is not copied.
                     da_wms = data_access['mmd:wms_layers']['mmd:wms_layer']
-                    if isinstance(da_wms, str):
-                        data_access_wms_layers = [da_wms]
-                    if isinstance(da_wms, list):
-                        data_access_wms_layers = list(da_wms)
-                    # old version was [i for i in data_access_wms_layers.values()][0]
-                    if data_access_wms_layers is not None:
-                        mydict[data_access_wms_layers_string] = data_access_wms_layers
-                        logger.debug("WMS layers: %s", data_access_wms_layers)
+                    if isinstance(da_wms, (str, list)):
+                        mydict['data_access_wms_layers'] = \
+                            [da_wms] if isinstance(da_wms, str) else da_wms
+                        logger.debug("WMS layers: %s", mydict['data_access_wms_layers'])
 
         logger.debug("Related dataset")
         # TODO
@@ -774,7 +751,7 @@ class MMD4SolR:
                     if '@relation_type' in e:
                         if e['@relation_type'] == 'parent':
                             logger.debug("Found parent")
-                            if '#text' in dict(e):
+                            if '#text' in e:
                                 mydict['related_dataset'] = e['#text']
                                 mydict['related_dataset_id'] = mydict['related_dataset']
                                 myid = to_solr_id(
@@ -783,13 +760,13 @@ class MMD4SolR:
                         if e['@relation_type'] == 'auxiliary':
                             logger.debug("Found auxiliary")
                             logger.debug(e)
-                            if '#text' in dict(e):
+                            if '#text' in e:
                                 mydict['related_dataset_auxiliary'] = e['#text']
                                 mydict['related_dataset_auxiliary_id'] = to_solr_id(
                                     mydict['related_dataset_auxiliary'])
             else:
                 # Not sure if this is used??
-                if '#text' in dict(mmd['mmd:related_dataset']):
+                if '#text' in mmd['mmd:related_dataset']:
                     mydict['related_dataset'] = mmd['mmd:related_dataset']['#text']
                     mydict['related_dataset_id'] = mydict['related_dataset']
                     myid = to_solr_id(mydict['related_dataset_id'])
@@ -798,67 +775,53 @@ class MMD4SolR:
         logger.debug("Storage information")
         storage_information = mmd.get("mmd:storage_information", None)
         if storage_information is not None:
-            file_name = storage_information.get("mmd:file_name", None)
-            file_location = storage_information.get("mmd:file_location", None)
-            file_format = storage_information.get("mmd:file_format", None)
+            for element, key in STORAGE_INFORMATION_FIELDS:
+                value = storage_information.get(element)
+                if value is not None:
+                    mydict[key] = str(value)
+            # File size and checksum are only indexed with their unit and type
             file_size = storage_information.get("mmd:file_size", None)
-            checksum = storage_information.get("mmd:checksum", None)
-            if file_name is not None:
-                mydict['storage_information_file_name'] = str(file_name)
-            if file_location is not None:
-                mydict['storage_information_file_location'] = str(
-                    file_location)
-            if file_format is not None:
-                mydict['storage_information_file_format'] = str(file_format)
             if file_size is not None:
-                if isinstance(file_size, dict):
-                    mydict['storage_information_file_size'] = str(
-                        file_size['#text'])
-                    mydict['storage_information_file_size_unit'] = str(
-                        file_size['@unit'])
-                else:
+                try:
+                    size, unit = str(file_size['#text']), str(file_size['@unit'])
+                except (TypeError, KeyError):
                     logger.warning(
                         "Filesize unit not specified, skipping field")
-            if checksum is not None:
-                if isinstance(checksum, dict):
-                    mydict['storage_information_file_checksum'] = str(
-                        checksum['#text'])
-                    mydict['storage_information_file_checksum_type'] = str(
-                        checksum['@type'])
                 else:
+                    mydict['storage_information_file_size'] = size
+                    mydict['storage_information_file_size_unit'] = unit
+            checksum = storage_information.get("mmd:checksum", None)
+            if checksum is not None:
+                try:
+                    value, checksum_type = str(checksum['#text']), str(checksum['@type'])
+                except (TypeError, KeyError):
                     logger.warning(
                         "Checksum type is not specified, skipping field")
+                else:
+                    mydict['storage_information_file_checksum'] = value
+                    mydict['storage_information_file_checksum_type'] = checksum_type
 
         logger.debug("Related information")
         if 'mmd:related_information' in mmd:
-            related_information_elements = mmd['mmd:related_information']
-
-            # Only one element
-            if isinstance(related_information_elements, dict):
-                # make it an iterable list
-                related_information_elements = [related_information_elements]
+            related_information_elements = _as_list(mmd['mmd:related_information'])
 
             for related_information in related_information_elements:
-                value = related_information['mmd:type']
-                if value in related_information_LUT.keys():
+                short = RELATED_INFORMATION_LUT.get(related_information['mmd:type'])
+                if short is not None:
+                    url_key = f'related_url_{short}'
+                    desc_key = f'related_url_{short}_desc'
                     # if list does not exist, create it
-                    if 'related_url_{}'.format(
-                            related_information_LUT[value]) not in mydict.keys():
-                        mydict['related_url_{}'.format(related_information_LUT[value])] = []
-                        mydict['related_url_{}_desc'.format(related_information_LUT[value])] = []
+                    if url_key not in mydict:
+                        mydict[url_key] = []
+                        mydict[desc_key] = []
 
                     # append elements to lists
-                    mydict['related_url_{}'.format(
-                        related_information_LUT[value])].append(
-                            related_information['mmd:resource'])
-                    ts = 'mmd:description'
-                    if ts in related_information and related_information[ts] is not None:
-                        mydict['related_url_{}_desc'.format(
-                            related_information_LUT[value])].append(
-                                related_information[ts])
+                    mydict[url_key].append(related_information['mmd:resource'])
+                    description = related_information.get('mmd:description')
+                    if description is not None:
+                        mydict[desc_key].append(description)
                     else:
-                        mydict['related_url_{}_desc'.format(
-                            related_information_LUT[value])].append('Not Available')
+                        mydict[desc_key].append('Not Available')
         logger.debug("ISO TopicCategory")
 
         if 'mmd:iso_topic_category' in mmd:
@@ -874,125 +837,26 @@ class MMD4SolR:
         # Added double indexing of GCMD keywords. keywords_gcmd (and keywords_wigos) are for
         # faceting in SolR. What is shown in data portal is keywords_keyword.
         if 'mmd:keywords' in mmd:
-            mydict['keywords_keyword'] = []
-            mydict['keywords_vocabulary'] = []
-            mydict['keywords_gcmd'] = []
-            mydict['keywords_wigos'] = []
-            mydict['keywords_gcmdloc'] = []
-            mydict['keywords_gcmdprov'] = []
-            mydict['keywords_cfstdn'] = []
-            mydict['keywords_gemet'] = []
-            mydict['keywords_northemes'] = []
+            keyword_list = mydict['keywords_keyword'] = []
+            vocabulary_list = mydict['keywords_vocabulary'] = []
+            # Keywords from some vocabularies are also added to a field for faceting
+            facet_lists = {}
+            for vocab, field in KEYWORD_VOCABULARY_FIELDS.items():
+                facet_lists[vocab] = mydict[field] = []
             logger.debug(mmd['mmd:keywords'])
-            # If there is only one keyword list
-            if isinstance(mmd['mmd:keywords'], dict):
-                vocab = mmd['mmd:keywords']['@vocabulary']
-                if isinstance(mmd['mmd:keywords']['mmd:keyword'], str):
-                    if vocab == "GCMDSK":
-                        mydict['keywords_gcmd'].append(
-                            mmd['mmd:keywords']['mmd:keyword'])
-                    mydict['keywords_keyword'].append(
-                        mmd['mmd:keywords']['mmd:keyword'])
-                    mydict['keywords_vocabulary'].append(vocab)
-                else:
-                    for elem in mmd['mmd:keywords']['mmd:keyword']:
-                        if isinstance(elem, str):
-                            if vocab == "GCMDSK":
-                                mydict['keywords_gcmd'].append(elem)
-                            if vocab == "WIGOS":
-                                mydict['keywords_wigos'].append(elem)
-                            if vocab == "GCMDLOC":
-                                mydict['keywords_gcmdloc'].append(elem)
-                            if vocab == "GCMDPROV":
-                                mydict['keywords_gcmdprov'].append(elem)
-                            if vocab == "CFSTDN":
-                                mydict['keywords_cfstdn'].append(elem)
-                            if vocab == "GEMET":
-                                mydict['keywords_gemet'].append(elem)
-                            if vocab == "NORTHEMES":
-                                mydict['keywords_northemes'].append(elem)
-                            mydict['keywords_vocabulary'].append(vocab)
-                            mydict['keywords_keyword'].append(elem)
-            # If there are multiple keyword lists
-            elif isinstance(mmd['mmd:keywords'], list):
-                for elem in mmd['mmd:keywords']:
-                    if isinstance(elem, dict):
-                        # Check for empty lists
-                        if len(elem) < 2:
-                            continue
-                        if isinstance(elem['mmd:keyword'], list):
-                            for keyword in elem['mmd:keyword']:
-                                if elem['@vocabulary'] == "GCMDSK":
-                                    mydict['keywords_gcmd'].append(keyword)
-                                if elem['@vocabulary'] == "WIGOS":
-                                    mydict['keywords_wigos'].append(keyword)
-                                if elem['@vocabulary'] == "GCMDLOC":
-                                    mydict['keywords_gcmdloc'].append(keyword)
-                                if elem['@vocabulary'] == "GCMDPROV":
-                                    mydict['keywords_gcmdprov'].append(keyword)
-                                if elem['@vocabulary'] == "CFSTDN":
-                                    mydict['keywords_cfstdn'].append(keyword)
-                                if elem['@vocabulary'] == "GEMET":
-                                    mydict['keywords_gemet'].append(keyword)
-                                if elem['@vocabulary'] == "NORTHEMES":
-                                    mydict['keywords_northemes'].append(keyword)
-                                mydict['keywords_vocabulary'].append(
-                                    elem['@vocabulary'])
-                                mydict['keywords_keyword'].append(keyword)
-                        else:
-                            # logger.debug(type(elem))
-                            if elem['@vocabulary'] == "GCMDSK":
-                                mydict['keywords_gcmd'].append(
-                                    elem['mmd:keyword'])
-                            if elem['@vocabulary'] == "WIGOS":
-                                mydict['keywords_wigos'].append(
-                                    elem['mmd:keyword'])
-                            if elem['@vocabulary'] == "GCMDLOC":
-                                mydict['keywords_gcmdloc'].append(
-                                    elem['mmd:keyword'])
-                            if elem['@vocabulary'] == "GCMDPROV":
-                                mydict['keywords_gcmdprov'].append(
-                                    elem['mmd:keyword'])
-                            if elem['@vocabulary'] == "CFSTDN":
-                                mydict['keywords_cfstdn'].append(
-                                    elem['mmd:keyword'])
-                            if elem['@vocabulary'] == "GEMET":
-                                mydict['keywords_gemet'].append(
-                                    elem['mmd:keyword'])
-                            if elem['@vocabulary'] == "NORTHEMES":
-                                mydict['keywords_northemes'].append(
-                                    elem['mmd:keyword'])
-                            mydict['keywords_vocabulary'].append(
-                                elem['@vocabulary'])
-                            mydict['keywords_keyword'].append(
-                                elem['mmd:keyword'])
-
-            else:
-                if mmd['mmd:keywords']['@vocabulary'] == "GCMDSK":
-                    mydict['keywords_gcmd'].append(
-                        mmd['mmd:keywords']['mmd:keyword'])
-                if mmd['mmd:keywords']['@vocabulary'] == "WIGOS":
-                    mydict['keywords_wigos'].append(
-                        mmd['mmd:keywords']['mmd:keyword'])
-                if mmd['mmd:keywords']['@vocabulary'] == "GCMDLOC":
-                    mydict['keywords_gcmdloc'].append(
-                        mmd['mmd:keywords']['mmd:keyword'])
-                if mmd['mmd:keywords']['@vocabulary'] == "GCMDPROV":
-                    mydict['keywords_gcmdprov'].append(
-                        mmd['mmd:keywords']['mmd:keyword'])
-                if mmd['mmd:keywords']['@vocabulary'] == "CFSTDN":
-                    mydict['keywords_cfstdn'].append(
-                        mmd['mmd:keywords']['mmd:keyword'])
-                if mmd['mmd:keywords']['@vocabulary'] == "GEMET":
-                    mydict['keywords_gemet'].append(
-                        mmd['mmd:keywords']['mmd:keyword'])
-                if mmd['mmd:keywords']['@vocabulary'] == "NORTHEMES":
-                    mydict['keywords_northemes'].append(
-                        mmd['mmd:keywords']['mmd:keyword'])
-                mydict['keywords_vocabulary'].append(
-                    mmd['mmd:keywords']['@vocabulary'])
-                mydict['keywords_keyword'].append(
-                    mmd['mmd:keywords']['mmd:keyword'])
+            for group in _as_list(mmd['mmd:keywords']):
+                # Skip empty keyword lists
+                if not isinstance(group, dict) or len(group) < 2:
+                    continue
+                vocab = group['@vocabulary']
+                facet_list = facet_lists.get(vocab)
+                for keyword in _as_list(group['mmd:keyword']):
+                    if not isinstance(keyword, str):
+                        continue
+                    if facet_list is not None:
+                        facet_list.append(keyword)
+                    vocabulary_list.append(vocab)
+                    keyword_list.append(keyword)
 
         logger.debug("Project")
         mydict['project_short_name'] = []
@@ -1022,35 +886,10 @@ class MMD4SolR:
         logger.debug("Platform")
         # FIXME add check for empty sub elements...
         if 'mmd:platform' in mmd:
-            platform_elements = mmd['mmd:platform']
-            # Only one element
-            if isinstance(platform_elements, dict):
-                # make it an iterable list
-                platform_elements = [platform_elements]
+            platform_elements = _as_list(mmd['mmd:platform'])
 
             for platform in platform_elements:
-                for platform_key, platform_value in platform.items():
-                    # if sub element is ordered dict
-                    if isinstance(platform_value, dict):
-                        for key, val in platform_value.items():
-                            local_key = key.split(":")[-1]
-                            element_name = f'platform_{platform_key.split(":")[-1]}_{local_key}'
-                            # create key in mydict
-                            if element_name not in mydict.keys():
-                                mydict[element_name] = []
-                                mydict[element_name].append(val)
-                            else:
-                                mydict[element_name].append(val)
-                    # sub element is not ordered dicts
-                    else:
-                        element_name = 'platform_{}'.format(
-                            platform_key.split(':')[-1])
-                        # create key in mydict. Repetition of above. Should be simplified.
-                        if element_name not in mydict.keys():
-                            mydict[element_name] = []
-                            mydict[element_name].append(platform_value)
-                        else:
-                            mydict[element_name].append(platform_value)
+                _append_elements(mydict, 'platform', platform, qualify=True)
 
                 # Add platform_sentinel for NBS
                 initial_platform = mydict['platform_long_name'][0]
@@ -1068,15 +907,11 @@ class MMD4SolR:
 
         logger.debug("Dataset citation")
         if 'mmd:dataset_citation' in mmd:
-            dataset_citation_elements = mmd['mmd:dataset_citation']
-            # Only one element
-            if isinstance(dataset_citation_elements, dict):
-                # make it an iterable list
-                dataset_citation_elements = [dataset_citation_elements]
+            dataset_citation_elements = _as_list(mmd['mmd:dataset_citation'])
 
             for dataset_citation in dataset_citation_elements:
                 for k, v in dataset_citation.items():
-                    element_suffix = k.split(':')[-1]
+                    element_suffix = _local(k)
                     # Fix issue between MMD and SolR schema, SolR requires full datetime, MMD not.
                     if element_suffix == 'publication_date':
                         if v is not None:
@@ -1091,11 +926,12 @@ class MMD4SolR:
 
         """ Adding MMD document as base64 string"""
         # Check if this can be simplified in the workflow.
-        xml_root = ET.parse(str(self.filename))
-        xml_string = ET.tostring(xml_root)
-        encoded_xml_string = base64.b64encode(xml_string)
-        xml_b64 = (encoded_xml_string).decode('utf-8')
-        mydict['mmd_xml_file'] = xml_b64
+        # Use the xml read with the file, and read the xml file only when it is not available
+        xml_string = self.xml_bytes
+        if xml_string is None:
+            with open(mmd_xml_filename(self.filename), 'rb') as fd:
+                xml_string = fd.read()
+        mydict['mmd_xml_file'] = binascii.b2a_base64(xml_string, newline=False).decode('ascii')
 
         """Set defualt parent/child flags"""
         mydict['isParent'] = False
@@ -1104,6 +940,165 @@ class MMD4SolR:
         return mydict
 
 
+def mmd_file_to_solr_doc(filename):
+    """
+    Read, check and convert one mmd file to a solr document.
+    Used as the worker function when files are converted in a process pool.
+    Returns the document and None, or None and the reason the file was skipped.
+    """
+    try:
+        mydoc = MMD4SolR(filename=filename)
+    except Exception as e:
+        return None, 'Could not handle file: %s. Error: %s' % (filename, e)
+    try:
+        mydoc.check_mmd()
+    except Exception as e:
+        return None, 'File: %s is not compliant with MMD specification. Error: %s' % (
+            filename, e)
+    try:
+        return mydoc.tosolr(), None
+    except Exception as e:
+        return None, 'Could not convert file %s to solr document.  Reason: %s' % (filename, e)
+
+
+def prepare_record(input_record, level, addThumbnail, thumbClass):
+    """ Prepare a solr document for indexing, adding thumbnail and feature type.
+        Used as the worker function when index_record prepares records
+        in a process pool, so only the record and settings are pickled.
+
+        Returns:
+            the document, and the WMS thumbnail task id or None
+    """
+    logger.info("Processing record %s", input_record['id'])
+    task_id = None
+    # Do some checking of content
+    if input_record['metadata_status'] == 'Inactive':
+        logger.warning('This record will be set inactive...')
+        # return False
+
+    """ Handle explicit dataset level parent/children relations"""
+    if level == 1:
+        input_record.update({'dataset_type': 'Level-1'})
+    if level == 2:
+        input_record.update({'dataset_type': 'Level-2'})
+        input_record.update({'isChild': True})
+
+    """
+    If OGC WMS is available, no point in looking for featureType in OPeNDAP.
+    """
+
+    if 'data_access_url_ogc_wms' in input_record and addThumbnail:
+        logger.info("Checking thumbnails...")
+        getCapUrl = input_record['data_access_url_ogc_wms']
+        if isinstance(getCapUrl, list):
+            getCapUrl = getCapUrl[0]
+
+        # logger.debug(type(getCapUrl))
+        # logger.debug(getCapUrl)
+        mmd_layers = None
+
+        if 'data_access_wms_layers' in input_record:
+            mmd_layers = input_record['data_access_wms_layers']
+        if mmd_layers is None:
+            mmd_layers = []
+        if (isinstance(thumbClass, dict)):
+            logger.debug("Creating WMS thumbnail using new API using url %s",
+                         getCapUrl)
+            # Each record gets its own copy of the thumbnail settings
+            wmsconfig = dict(thumbClass)
+            wmsconfig.update({'wms_url': getCapUrl})
+            wmsconfig.update({'wms_layers_mmd': mmd_layers})
+            wmsconfig.update({'id': input_record['id']})
+
+            logger.debug("Creating wms with config: %s", wmsconfig)
+            response = create_wms_thumbnail_api(wmsconfig)
+            logger.debug("WMS api response: %s", response)
+            error = response.get('error')
+            status_code = response.get('status_code')
+            if error is None and status_code == 200:
+                thumbnail_url = response.get("data", None).get("thumbnail_url", None)
+                if thumbnail_url is not None:
+                    logger.debug("Adding thumbnail_url field with value: %s",
+                                 thumbnail_url)
+                    input_record.update({'thumbnail_url': thumbnail_url})
+                # else:
+                #     logger.warning("Could not properly generate thumbnail")
+                #     # If WMS is not available, remove this data_access element
+                #     # from the XML that is indexed
+                #     del input_record['data_access_url_ogc_wms']
+            else:
+                logger.error(
+                    "Could not generate thumbnail, reason: %s, status_code %s",
+                    error, status_code)
+            # Task id for later processing
+            task_id = response.get("data", None).get("task_id", None)
+        else:
+            logger.debug("Creating WMS thumbnail using legacy method using url: %s",
+                         getCapUrl)
+            try:
+                thumbnail_data = thumbClass.create_wms_thumbnail(getCapUrl, input_record['id'],
+                                                                 mmd_layers)
+            except Exception as e:
+                logger.error("Thumbnail creation from OGC WMS failed: %s", e)
+                thumbnail_data = None
+
+            if thumbnail_data is None:
+                logger.warning(
+                    'Could not properly parse WMS GetCapabilities document')
+                # If WMS is not available, remove this data_access element
+                # from the XML that is indexed
+                del input_record['data_access_url_ogc_wms']
+            else:
+                input_record.update({'thumbnail_data': thumbnail_data})
+
+    if 'data_access_url_opendap' in input_record:
+        # Thumbnail of timeseries to be added
+        # Or better do this as part of get_feature_type?
+        logger.info("Processing feature type")
+        input_record = process_feature_type(input_record)
+
+    return input_record, task_id
+
+
+class SolrBatcher:
+    """ Collect solr documents and add them to SolR in batches, so that
+    one request is sent per batch instead of one per document.
+    Can be used as a context manager, which adds the last batch on exit.
+    The batches are posted with the session of the pysolr connection.
+    If commit_within (milliseconds) is set, SolR commits the added
+    documents within that time, and batches its commits server side.
+    """
+
+    def __init__(self, solrc, flush_at=500, commit_within=None):
+        self.solrc = solrc
+        self.flush_at = flush_at
+        self.commit_within = commit_within
+        self._buf = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, doc):
+        """Add a document, and send the batch when it is full.
+        Return the documents sent, if any."""
+        self._buf.append(doc)
+        if len(self._buf) >= self.flush_at:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Send the collected documents to SolR, and return them"""
+        if len(self._buf) == 0:
+            return []
+        docs, self._buf = self._buf, []
+        solr_add(docs, solrc=self.solrc, commit_within=self.commit_within)
+        return docs
+
+
 class IndexMMD:
     """ Class for indexing SolR representation of MMD to SolR server. Requires
     a list of dictionaries representing MMD as input.
@@ -1137,15 +1132,41 @@ class IndexMMD:
         # Keep track of wms url tasks for later results.
         self.wms_task_list = []
 
+        # Datasets fetched from SolR, by id, with the time they were fetched
+        self._dataset_cache = OrderedDict()
+        # Ids of datasets known to be marked as parents in SolR
+        self._known_parents = set()
+        # Ids of parents updated in batches, not yet reported by flush_parents
+        self._batched_parents = set()
+
         # Connecting to core
         try:
             self.solrc = pysolr.Solr(mysolrserver, always_commit=always_commit, timeout=1020,
                                      auth=self.authentication)
+            # The requests made here reuse the pooled connections of the pysolr session.
+            # Requests failing to connect or getting a gateway error are retried.
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64,
+                                  max_retries=Retry(total=3, backoff_factor=0.2,
+                                                    status_forcelist=(502, 503, 504)))
+            session = self.solrc.get_session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
             logger.info("Connection established to: %s", str(mysolrserver))
         except Exception as e:
             logger.error("Something failed in SolR init: %s", str(e))
             raise e
 
+    def __getstate__(self):
+        # The pysolr connection can not be pickled, and the caches
+        # and task list are only of use to this instance.
+        state = self.__dict__.copy()
+        state['solrc'] = None
+        state['_dataset_cache'] = OrderedDict()
+        state['_known_parents'] = set()
+        state['_batched_parents'] = set()
+        state['wms_task_list'] = []
+        return state
+
     # Function for sending explicit commit to solr
     def commit(self):
         self.solrc.commit()
@@ -1183,7 +1204,7 @@ class IndexMMD:
             Returns:
                 thumbnail: base64 string representation of image
         """
-        logger.info("adding thumbnail for: %s" % url)
+        logger.info("adding thumbnail for: %s", url)
         if thumbnail_type == 'wms':
             try:
                 thumbnail = self.thumbClass.create_wms_thumbnail(url, self.id, wms_layers_mmd)
@@ -1214,7 +1235,8 @@ class IndexMMD:
             logger.debug("No wms url. Skipping thumbnail generation")
             return None
 
-    def index_record(self, records2ingest, addThumbnail, level=None, thumbClass=None):
+    def index_record(self, records2ingest, addThumbnail, level=None, thumbClass=None,
+                     batch_size=500, commit_within=None, workers=None):
         # FIXME, update the text below Øystein Godøy, METNO/FOU, 2023-03-19
         """ Add thumbnail to SolR
             Args:
@@ -1222,6 +1244,11 @@ class IndexMMD:
                 addThumbnail (bool): If thumbnail should be added or not
                 level (1,2,None): Explicitt tell indexer what level the record have.
                 thumbClass (Class): A class with the thumbnail genration.
+                batch_size (int): Number of records sent to SolR in each request.
+                commit_within (int): Let SolR commit the records within this
+                    many milliseconds. Not set by default.
+                workers (int): Number of processes used to prepare the records.
+                    Records are prepared in this process by default.
 
             Returns:
                 bool, msg
@@ -1238,118 +1265,55 @@ class IndexMMD:
 
         logger.debug("Thumbnail flag is: %s", addThumbnail)
 
-        mmd_records = list()
+        # Records are prepared in parallel processes when workers is set,
+        # and sent to SolR in batches as they are returned
+        batcher = SolrBatcher(self.solrc, flush_at=batch_size, commit_within=commit_within)
         norec = len(records2ingest)
-        i = 1
-        for input_record in records2ingest:
-            logger.info("====>")
-            logger.info("Processing record %d of %d", i, norec)
-            i += 1
-            # Do some checking of content
-            self.id = input_record['id']
-            if input_record['metadata_status'] == 'Inactive':
-                logger.warning('This record will be set inactive...')
-                # return False
-            myfeature = None
-
-            """ Handle explicit dataset level parent/children relations"""
-            if level == 1:
-                input_record.update({'dataset_type': 'Level-1'})
-            if level == 2:
-                input_record.update({'dataset_type': 'Level-2'})
-                input_record.update({'isChild': True})
-
-            """
-            If OGC WMS is available, no point in looking for featureType in OPeNDAP.
-            """
-
-            if 'data_access_url_ogc_wms' in input_record and addThumbnail:
-                logger.info("Checking thumbnails...")
-                getCapUrl = input_record['data_access_url_ogc_wms']
-                if isinstance(getCapUrl, list):
-                    getCapUrl = getCapUrl[0]
-
-                # logger.debug(type(getCapUrl))
-                # logger.debug(getCapUrl)
-                mmd_layers = None
-
-                if 'data_access_wms_layers' in input_record:
-                    mmd_layers = input_record['data_access_wms_layers']
-                if mmd_layers is None:
-                    mmd_layers = []
-                if not myfeature:
-                    self.thumbnail_type = 'wms'
-                if (isinstance(thumbClass, dict)):
-                    logger.debug("Creating WMS thumbnail using new API using url %s", getCapUrl)
-                    thumbClass.update({'wms_url': getCapUrl})
-                    thumbClass.update({'wms_layers_mmd': mmd_layers})
-
-                    response = self.add_thumbnail_api(thumbClass)
-                    logger.debug("WMS api response: %s", response)
-                    error = response.get('error')
-                    status_code = response.get('status_code')
-                    if error is None and status_code == 200:
-                        thumbnail_url = response.get("data", None).get("thumbnail_url", None)
-                        if thumbnail_url is not None:
-                            logger.debug("Adding thumbnail_url field with value: %s",
-                                         thumbnail_url)
-                            input_record.update({'thumbnail_url': thumbnail_url})
-                        # else:
-                        #     logger.warning("Could not properly generate thumbnail")
-                        #     # If WMS is not available, remove this data_access element
-                        #     # from the XML that is indexed
-                        #     del input_record['data_access_url_ogc_wms']
-                    else:
-                        logger.error("Could not generate thumbnail, reason: %s, status_code %s",
-                                     error, status_code)
-                    # Store task id for later processing
-                    task_id = response.get("data", None).get("task_id", None)
-                    if task_id is not None:
-                        logger.debug("Added task_id: %s to list.", task_id)
-                        self.wms_task_list.append(task_id)
-                else:
-                    logger.debug("Creating WMS thumbnail using legacy method using url: %s",
-                                 getCapUrl)
-                    thumbnail_data = self.add_thumbnail(getCapUrl, mmd_layers)
-
-                    if thumbnail_data is None:
-                        logger.warning(
-                            'Could not properly parse WMS GetCapabilities document')
-                        # If WMS is not available, remove this data_access element
-                        # from the XML that is indexed
-                        del input_record['data_access_url_ogc_wms']
-                    else:
-                        input_record.update({'thumbnail_data': thumbnail_data})
-
-            if 'data_access_url_opendap' in input_record:
-                # Thumbnail of timeseries to be added
-                # Or better do this as part of get_feature_type?
-                logger.info("Processing feature type")
-                input_record = process_feature_type(input_record)
-
-            logger.info("Adding records to list...")
-            mmd_records.append(input_record)
-
-        """
-        Send information to SolR
-        """
+        prepare = functools.partial(prepare_record, level=level, addThumbnail=addThumbnail,
+                                    thumbClass=thumbClass)
+        executor = None
+        if workers is not None and workers > 1 and norec > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            prepared = executor.map(prepare, records2ingest, chunksize=16)
+        else:
+            prepared = map(prepare, records2ingest)
         logger.info("Adding records to SolR core.")
         try:
-            self.solrc.add(mmd_records)
-        except Exception as e:
+            for i, (input_record, task_id) in enumerate(prepared, start=1):
+                logger.info("Adding record %d of %d to batch...", i, norec)
+                # Store task id for later processing
+                if task_id is not None:
+                    logger.debug("Added task_id: %s to list.", task_id)
+                    self.wms_task_list.append(task_id)
+                batcher.add(input_record)
+                # A re-indexed parent must be marked as parent again
+                if not input_record.get('isParent'):
+                    self._known_parents.discard(input_record['id'])
+            batcher.flush()
+        except (pysolr.SolrError, requests.exceptions.RequestException,
+                orjson.JSONEncodeError) as e:
             msg = "Something failed in SolR adding document: %s" % str(e)
             logger.critical(msg)
             return False, msg
+        finally:
+            if executor is not None:
+                executor.shutdown()
         msg = "Record successfully added."
         logger.info("Record successfully added.")
 
-        del mmd_records
-
         return True, msg
 
+    def prepare_record(self, input_record, addThumbnail, level=None):
+        """ Prepare a solr document for indexing, see the module level
+            function prepare_record.
+        """
+        return prepare_record(input_record, level, addThumbnail, self.thumbClass)
+
     def get_feature_type(self, myopendap):
         """ Set feature type from OPeNDAP """
         logger.info("Now in get_feature_type")
+        # netCDF4 loads HDF5 and numpy, so it is only imported when a dataset is opened
+        import netCDF4
 
         # Open as OPeNDAP
         try:
@@ -1367,8 +1331,7 @@ class IndexMMD:
             raise
         ds.close()
 
-        if featureType not in ['point', 'timeSeries', 'trajectory', 'profile', 'timeSeriesProfile',
-                               'trajectoryProfile']:
+        if featureType not in VALID_FEATURE_TYPES:
             logger.warning(
                 "The featureType found - %s - is not valid", featureType)
             logger.warning("Fixing this locally")
@@ -1422,61 +1385,110 @@ class IndexMMD:
 
         logger.info("Records successfully deleted from thumbnail core")
 
-    def search(self):
-        """ Require Id as input """
-        try:
-            results = pysolr.search(
-                'mmd_title:Sea Ice Extent', df='text_en', rows=100)
-        except Exception as e:
-            logger.error("Something failed during search: %s", str(e))
-
-        return results
+    def search(self, q, fl=None, rows=200):
+        """
+        Search the index, yielding the documents found.
+        The results are fetched rows at a time with a cursor, so large
+        result sets are not held in memory. Only the id is returned
+        unless fl is given.
+        """
+        cursor = '*'
+        while True:
+            try:
+                results = self.solrc.search(q, cursorMark=cursor, sort='id asc',
+                                            rows=rows, fl=fl or 'id')
+            except Exception as e:
+                logger.error("Something failed during search: %s", str(e))
+                raise
+            yield from results.docs
+            if results.nextCursorMark is None or results.nextCursorMark == cursor:
+                break
+            cursor = results.nextCursorMark
 
     def darextract(self, mydar):
         mylinks = {}
-        for i in range(len(mydar)):
-            if isinstance(mydar[i], bytes):
-                mystr = str(mydar[i], 'utf-8')
-            else:
-                mystr = mydar[i]
-            if mystr.find('description') != -1:
-                t1, t2 = mystr.split(',', 1)
-            else:
-                t1 = mystr
-            t2 = t1.replace('"', '')
-            proto, myurl = t2.split(':', 1)
+        for mystr in mydar:
+            if isinstance(mystr, bytes):
+                mystr = mystr.decode('utf-8')
+            # Drop the description following the link
+            if 'description' in mystr:
+                mystr = mystr.partition(',')[0]
+            proto, myurl = mystr.replace('"', '').split(':', 1)
             mylinks[proto] = myurl
 
         return (mylinks)
 
-    def delete(self, id, commit=False):
-        """Delete document with given metadata identifier"""
+    def delete(self, id, commit=False, verify=False, commit_within=None,
+               soft_commit=False):
+        """
+        Delete document with given metadata identifier.
+        Deleting an id not in the index is a no-op in SolR, so the
+        document is only looked up first if verify is True.
+
+        commit does a hard commit in the same request as the delete.
+        When deleting many documents, use commit_within (ms) or
+        soft_commit instead, and commit once at the end.
+        """
         solr_id = to_solr_id(id)
-        doc_exsists = self.get_dataset(solr_id)
-        if (doc_exsists["doc"] is None):
-            return False, "Document %s not found in index." % id
+        if verify:
+            doc_exsists = self.get_dataset(solr_id, fl='id')
+            if doc_exsists is None or doc_exsists["doc"] is None:
+                return False, "Document %s not found in index." % id
         try:
-            self.solrc.delete(id=solr_id)
+            if commit_within is not None and not commit:
+                solr_delete([solr_id], solrc=self.solrc,
+                            commit_within=commit_within)
+            else:
+                self.solrc.delete(id=solr_id, commit=True if commit else None,
+                                  softCommit=soft_commit)
         except Exception as e:
             logger.error(
                 "Something went wrong deleting doucument with id: %s", id)
             return False, e
+        self._dataset_cache.pop(solr_id, None)
+        self._known_parents.discard(solr_id)
         logger.info("Sucessfully deleted document with id: %s", id)
-        if commit:
-            logger.info("Commiting deletion")
-            self.commit()
         return True, "Document %s sucessfully deleted" % id
 
-    def get_dataset(self, id):
+    def delete_many(self, ids, batch=500, commit_within=None):
+        """
+        Delete the documents with the given metadata identifiers,
+        sending batch ids per request. Returns the number of ids sent.
+        """
+        ids = iter(ids)
+        count = 0
+        while True:
+            chunk = [to_solr_id(id) for id in itertools.islice(ids, batch)]
+            if not chunk:
+                break
+            solr_delete(chunk, solrc=self.solrc, commit_within=commit_within)
+            for solr_id in chunk:
+                self._dataset_cache.pop(solr_id, None)
+                self._known_parents.discard(solr_id)
+            count += len(chunk)
+        logger.info("Deleted %d documents", count)
+        return count
+
+    def get_dataset(self, id, fl=None):
         """
         Use real-time get to fetch latest dataset
-        based on id.
+        based on id. If fl is given, only these fields are returned,
+        e.g. fl='id' to check if the dataset exists.
         """
-        res = None
+        params = {'wt': 'json', 'id': id}
+        if fl is not None:
+            params['fl'] = fl
+        dataset = None
         try:
-            res = requests.get(self.solr_url + '/get?wt=json&id=' + id,
-                               auth=self.authentication)
-            res.raise_for_status()
+            # The body is read straight from the stream into orjson,
+            # without requests keeping its own copy in res.content.
+            with self.solrc.get_session().get(self.solr_url + '/get',
+                                              params=params,
+                                              headers={'Accept': 'application/json'},
+                                              auth=self.authentication, timeout=(3, 30),
+                                              stream=True) as res:
+                res.raise_for_status()
+                dataset = orjson.loads(res.raw.read(decode_content=True))
         except requests.exceptions.HTTPError as errh:
             logger.error("Http Error: %s", errh)
         except requests.exceptions.ConnectionError as errc:
@@ -1485,12 +1497,53 @@ class IndexMMD:
             logger.error("Timeout Error: %s", errt)
         except requests.exceptions.RequestException as err:
             logger.error("OOps: Something Else went wrong: %s", err)
+        except urllib3.exceptions.HTTPError as err:
+            logger.error("Error reading response: %s", err)
 
-        if res is None:
-            return None
+        return dataset
+
+    def _get_dataset_cached(self, id):
+        """
+        get_dataset, with the datasets found kept for DATASET_CACHE_TTL seconds.
+        Parents are looked up for each of their children, so the same dataset
+        is often fetched several times in a row.
+        """
+        now = time.monotonic()
+        entry = self._dataset_cache.get(id)
+        if entry is not None and now - entry[0] < DATASET_CACHE_TTL:
+            self._dataset_cache.move_to_end(id)
+            return entry[1]
+        dataset = self.get_dataset(id)
+        # Missing datasets are not cached, as they may be indexed shortly
+        if dataset is not None and dataset.get('doc') is not None:
+            self._cache_dataset(id, dataset, now)
         else:
-            dataset = res.json()
-            return dataset
+            self._dataset_cache.pop(id, None)
+        return dataset
+
+    def _cache_dataset(self, id, dataset, now=None):
+        """Store a dataset in the cache, dropping the least recently used ones"""
+        self._dataset_cache[id] = (time.monotonic() if now is None else now, dataset)
+        self._dataset_cache.move_to_end(id)
+        while len(self._dataset_cache) > DATASET_CACHE_SIZE:
+            self._dataset_cache.popitem(last=False)
+
+    def _parents_updated(self, docs):
+        """Keep track of parent documents sent to SolR in a batch"""
+        for doc in docs:
+            self._cache_dataset(doc['id'], {'doc': doc})
+            self._known_parents.add(doc['id'])
+            self._batched_parents.add(doc['id'])
+
+    def flush_parents(self, batcher):
+        """Send the last batch of parent updates queued by update_parent.
+        Return the set of parent ids updated in batches since the last call."""
+        try:
+            self._parents_updated(batcher.flush())
+        except Exception as e:
+            logger.error("Batched update failed on parents. Error is: %s", e)
+        updated, self._batched_parents = self._batched_parents, set()
+        return updated
 
     @staticmethod
     def _solr_update_parent_doc(parent):
@@ -1498,27 +1551,15 @@ class IndexMMD:
         Update the parent document we got from solr.
         some fields need to be removed for solr to accept the update.
         """
-        if 'full_text' in parent:
-            parent.pop('full_text')
-        if 'bbox__maxX' in parent:
-            parent.pop('bbox__maxX')
-        if 'bbox__maxY' in parent:
-            parent.pop('bbox__maxY')
-        if 'bbox__minX' in parent:
-            parent.pop('bbox__minX')
-        if 'bbox__minY' in parent:
-            parent.pop('bbox__minY')
-        if 'bbox_rpt' in parent:
-            parent.pop('bbox_rpt')
-        if 'ss_access' in parent:
-            parent.pop('ss_access')
-        if '_version_' in parent:
-            parent.pop('_version_')
+        # The document is updated in place, callers may keep using it
+        for field in PARENT_STRIP_FIELDS:
+            parent.pop(field, None)
 
         parent['isParent'] = True
         return parent
 
-    def update_parent(self, parentid, fail_on_missing=False, handle_missing_status=True):
+    def update_parent(self, parentid, fail_on_missing=False, handle_missing_status=True,
+                      batcher=None):
         """Search index for parent and update parent flag.
 
             Parameters:
@@ -1528,8 +1569,14 @@ class IndexMMD:
                                         this parameter is used to return false or true
                                         back to the calling code. Logs a warning about
                                         missing parent.
+                batcher - (SolrBatcher) If given, the updated parent is added to
+                          the batcher instead of being sent to SolR at once, and
+                          None is returned as status. The caller sends the last
+                          batch with flush_parents, which returns the parents updated.
         """
-        myparent = self.get_dataset(parentid)
+        if parentid in self._known_parents:
+            return True, "Already updated."
+        myparent = self._get_dataset_cached(parentid)
 
         if myparent is None:
             return False, "No parent found in index."
@@ -1549,10 +1596,21 @@ class IndexMMD:
                         myparent['doc']['metadata_identifier'])
             if bool(myparent['doc']['isParent']):
                 logger.info("Dataset already marked as parent.")
+                self._known_parents.add(parentid)
                 return True, "Already updated."
             else:
                 # doc = {'id': parentid, 'isParent': True}
-                doc = self._solr_update_parent_doc(myparent['doc'])
+                # The cached document is only replaced when the update succeeds
+                doc = self._solr_update_parent_doc(dict(myparent['doc']))
+                if batcher is not None:
+                    # The parents are only marked as updated once their batch is sent
+                    try:
+                        self._parents_updated(batcher.add(doc))
+                    except Exception as e:
+                        logger.error("Batched update failed on parents. Error is: %s", e)
+                        return False, e
+                    logger.info("Parent update queued.")
+                    return None, "Parent update queued."
                 try:
                     # self.solrc.add([doc], fieldUpdates={'isParent': 'set'})
                     self.solrc.add([doc])
@@ -1560,5 +1618,7 @@ class IndexMMD:
                     logger.error(
                         "Atomic update failed on parent %s. Error is: ", (parentid, e))
                     return False, e
+                self._cache_dataset(parentid, {'doc': doc})
+                self._known_parents.add(parentid)
                 logger.info("Parent sucessfully updated in SolR.")
                 return True, "Parent updated."
@@ -17,8 +17,9 @@ implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
+import orjson
 import logging
-import xmltodict
+import lxml.etree as ET
 from pathlib import Path
 
 from concurrent.futures import ThreadPoolExecutor
@@ -26,10 +27,106 @@ from concurrent.futures import ThreadPoolExecutor
 # Logging Setup
 logger = logging.getLogger(__name__)
 
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+# Suffix of mmd files already converted to json with the mmd2json script
+MMD_JSON_SUFFIX = '.mmd.json'
+
+
+def _element_to_dict(elem, prefixes):
+    """Convert an element to the same structure as xmltodict would"""
+    node = {}
+    for key, value in elem.attrib.items():
+        if key[0] == '{':
+            uri, _, name = key[1:].partition('}')
+            prefix = prefixes.get(uri)
+            key = prefix + ':' + name if prefix else name
+        node['@' + key] = value
+
+    text = [elem.text] if elem.text else []
+    for child in elem:
+        if child.tail:
+            text.append(child.tail)
+        tag = child.tag
+        if not isinstance(tag, str):
+            # Skip comments and processing instructions
+            continue
+        prefix = child.prefix
+        tag = tag.rpartition('}')[2]
+        key = prefix + ':' + tag if prefix else tag
+        value = _element_to_dict(child, prefixes)
+        if key in node:
+            if isinstance(node[key], list):
+                node[key].append(value)
+            else:
+                node[key] = [node[key], value]
+        else:
+            node[key] = value
+
+    text = ''.join(text).strip() or None
+    if not node:
+        return text
+    if text is not None:
+        node['#text'] = text
+    return node
+
+
+def parse_xml(xml):
+    """
+    Parse xml bytes with lxml and convert to dict
+    with the same layout as xmltodict.parse.
+    Namespace declarations are only reported for the root element,
+    which is where MMD declares them.
+    """
+    # Entities are not resolved and no network access is allowed, as with
+    # xmltodict. Parsers are cheap, and a new one avoids sharing across threads.
+    parser = ET.XMLParser(resolve_entities=False, no_network=True, huge_tree=False)
+    root = ET.fromstring(xml, parser)
+    nsmap = root.nsmap
+    prefixes = {uri: prefix for prefix, uri in nsmap.items() if prefix is not None}
+    prefixes[XML_NAMESPACE] = 'xml'
+
+    node = {}
+    for prefix, uri in nsmap.items():
+        node['@xmlns:' + prefix if prefix else '@xmlns'] = uri
+    content = _element_to_dict(root, prefixes)
+    if isinstance(content, dict):
+        node.update(content)
+    elif node and content is not None:
+        node['#text'] = content
+    elif not node:
+        node = content
+
+    prefix = root.prefix
+    tag = root.tag.rpartition('}')[2]
+    return {prefix + ':' + tag if prefix else tag: node}
+
+
+def mmd_xml_filename(filename):
+    """
+    Name of the mmd xml file. For a file converted by mmd2json,
+    this is the xml file it was converted from.
+    """
+    filename = str(filename)
+    if filename.endswith(MMD_JSON_SUFFIX):
+        return filename[:-len(MMD_JSON_SUFFIX)] + '.xml'
+    return filename
+
+
+def parse_mmd(data, filename):
+    """
+    Parse the content of an mmd file to dict.
+    Files converted by mmd2json are json, which is much faster to load than xml.
+    """
+    if str(filename).endswith(MMD_JSON_SUFFIX):
+        return orjson.loads(data)
+    return parse_xml(data)
+
 
 def load_file(filename):
     """
-    Load xml file and convert to dict using xmltodict
+    Load xml file and convert to dict using lxml.
+    Files converted by mmd2json are loaded as json.
     """
     filename = str(filename).strip().rstrip()
     try:
@@ -37,14 +134,14 @@ def load_file(filename):
     except Exception as e:
         logger.error('Not a valid filepath %s error was %s' % (filename, e))
         return None
-    with open(file, encoding='utf-8') as fd:
+    with open(file, 'rb') as fd:
         try:
             xmlfile = fd.read()
         except Exception as e:
             logger.error('Could not read file %s error was %s' % (filename, e))
             return None
         try:
-            mmddict = xmltodict.parse(xmlfile)
+            mmddict = parse_mmd(xmlfile, filename)
         except Exception as e:
             logger.error('Could not parse the xmlfile: %s  with error %s' % (filename, e))
             return None
@@ -29,7 +29,7 @@ import cartopy.crs as ccrs
 
 from datetime import datetime
 from requests.auth import HTTPBasicAuth
-from solrindexer.tools import find_xml_files, flatten, initThumb, initSolr
+from solrindexer.tools import find_xml_files, initThumb, initSolr
 from solrindexer.tools import solr_commit, solr_add, get_dataset
 from solrindexer.searchindex import parse_cfg
 from solrindexer.bulkindexer import BulkIndexer
@@ -37,7 +37,6 @@ from solrindexer.indexdata import IndexMMD
 
 from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures import as_completed
-from concurrent import futures as Futures
 
 from solrindexer.thumb.thumbnail import WMSThumbNail
 
@@ -172,6 +171,15 @@ def main():
     if 'threads' in cfg:
         threads = cfg["threads"]
 
+    # Number of processes parsing files in each worker, see below for the default
+    processes = cfg.get('parse-processes', None)
+
+    # Adapt the batch size to how fast solr indexes the documents
+    adaptive = cfg.get('adaptive-batch-size', False)
+
+    # Do not index datasets that are already in the index
+    skip_existing = cfg.get('skip-existing', False)
+
     # Should we commit to solr at the end of execution?
     end_solr_commit = False
     if 'end-solr-commit' in cfg:
@@ -288,11 +296,12 @@ def main():
     logger.info("Starting processing at: %s", now.strftime("%Y-%m-%d %H:%M:%S"))
 
     """ Create an instance of the BulkIndexer"""
-    logger.info("Creating bulkindexer with chunks %d and threads/processes %d.",
+    logger.info("Creating bulkindexer with chunks %d and threads %d.",
                 chunksize, threads)
     bulkindexer = BulkIndexer(myfiles, mySolRc, threads=threads,
                               chunksize=chunksize, auth=authentication,
-                              tflg=tflg, thumbClass=thumbClass)
+                              tflg=tflg, thumbClass=thumbClass, processes=processes,
+                              adaptive=adaptive, skip_existing=skip_existing)
     """
     Indexing start. The inputlist is split into as many lists as input workers.
     Each worker will process the lists and return back the information needed to track the
@@ -321,12 +330,15 @@ def main():
 
     # We only do multiprocessing if workers is 2 or more
     if workers > 1:
+        # By default the cpus are shared between the workers
+        if processes is None:
+            processes = max(1, (os.cpu_count() or 1) // workers)
         workerlistsize = round(len(myfiles)/workers)
         logger.debug("Using multiple processes.")
         # Split the inputfiles into lists for each worker.
         workerFileLists = [
             myfiles[i: i + workerlistsize] for i in range(0, len(myfiles), workerlistsize)]
-        logger.debug("Input list: %s" % len(flatten(workerFileLists)))
+        logger.debug("Input list: %s", len(myfiles))
         futures_list = list()
         job = 1
         with ProcessPoolExecutor(max_workers=workers) as executor:
@@ -334,7 +346,8 @@ def main():
                 logger.info("Submitting worker job %d - with %d files", job, len(fileList))
                 bulkidx = BulkIndexer(fileList, mySolRc, threads=threads,
                                       chunksize=chunksize, auth=authentication,
-                                      tflg=tflg, thumbClass=thumbClass)
+                                      tflg=tflg, thumbClass=thumbClass, processes=processes,
+                                      adaptive=adaptive, skip_existing=skip_existing)
                 future = executor.submit(bulkidx.bulkindex, fileList)
 
                 futures_list.append(future)
@@ -361,7 +374,6 @@ def main():
                     docs_failed += docs_failed_
                     docs_indexed += docs_indexed_
                     logger.info("%s docs indexed so far." % docs_indexed)
-        Futures.ALL_COMPLETED
     # Bulkindex using main process.
     else:
         logger.debug("Using ONE process.")
@@ -381,7 +393,6 @@ def main():
         docs_failed += docs_failed_
         docs_indexed += docs_indexed_
 
-    Futures.ALL_COMPLETED
     # TODO: Add last parent missing index check here. after refactor this logic
     # summary of possible missing parents
     missing = list(set(parent_ids_found) - set(parent_ids_processed))
@@ -397,7 +408,7 @@ def main():
                     myparent['doc']['id'], myparent['doc']['isParent'])
                 # Check if already flagged
                 if myparent['doc']['isParent'] is False:
-                    logger.debug('Update on indexed parent %s, isParent: True' % pid)
+                    logger.debug('Update on indexed parent %s, isParent: True', pid)
                     mydoc = IndexMMD._solr_update_parent_doc(myparent['doc'])
                     doc_ = mydoc
                     try:
@@ -442,7 +453,7 @@ def main():
                     myparent['doc']['id'], myparent['doc']['isParent'])
                 # Check if already flagged
                 if myparent['doc']['isParent'] is False:
-                    logger.debug('Update on indexed parent %s, isParent: True' % pid)
+                    logger.debug('Update on indexed parent %s, isParent: True', pid)
                     mydoc = IndexMMD._solr_update_parent_doc(myparent['doc'])
                     doc_ = mydoc
                     try:
@@ -477,17 +488,17 @@ def main():
 
     logger.info("====== INDEX END ===== %s files processed with %s workers and batch size %s ==",
                 len(myfiles), workers, chunksize)
-    logger.info("Parent ids found: %s" % len(parent_ids_found))
-    logger.info("Parent ids processed: %s" % len(parent_ids_processed))
-    logger.info("Parent ids pending: %s" % len(parent_ids_pending))
-    logger.info("Document ids processed: %s" % len(doc_ids_processed))
+    logger.info("Parent ids found: %d", len(parent_ids_found))
+    logger.info("Parent ids processed: %d", len(parent_ids_processed))
+    logger.info("Parent ids pending: %d", len(parent_ids_pending))
+    logger.info("Document ids processed: %d", len(doc_ids_processed))
     logger.info("===============================================================================")
 
     # summary of possible missing parents
     missing = list(set(parent_ids_found) - set(parent_ids_processed))
     if len(missing) != 0:
         logger.warning('Missing parents in input. %s' % missing)
-        logger.info('Could not find the following parents: %s' % missing)
+        logger.info("Could not find the following parents: %s", missing)
     docs_failed = len(myfiles) - docs_indexed
     if docs_failed != 0:
         logger.warning('%d documents could not be indexed. check output and logfile.', docs_failed)
@@ -504,7 +515,7 @@ def main():
     elapsed_time = et - st
     pelt = pet - pst
     logger.info("Processed %s documents" % processed)
-    logger.info("Files / documents failed: %s" % docs_failed)
+    logger.info("Files / documents failed: %s", docs_failed)
     logger.info('Execution time: %s', time.strftime("%H:%M:%S", time.gmtime(elapsed_time)))
     logger.info('CPU time: %s', time.strftime("%H:%M:%S", time.gmtime(pelt)))
     if end_solr_commit:
@@ -29,7 +29,9 @@ import time
 from datetime import datetime
 
 from requests.auth import HTTPBasicAuth
-from solrindexer.indexdata import MMD4SolR, IndexMMD
+from concurrent.futures import ProcessPoolExecutor
+from solrindexer.indexdata import IndexMMD, SolrBatcher, mmd_file_to_solr_doc
+from solrindexer.multithread.io import MMD_JSON_SUFFIX
 from solrindexer.tools import to_solr_id
 from solrindexer.searchindex import parse_cfg
 
@@ -154,6 +156,12 @@ def main():
     if 'end-solr-commit' in cfg:
         end_solr_commit = cfg['end-solr-commit']
 
+    # Number of records per add request, and optional commitWithin in ms
+    solr_batch_size = cfg.get('solr-batch-size', 500)
+    solr_commit_within = cfg.get('solr-commit-within', None)
+    # Number of processes preparing records (thumbnails, feature type) for indexing
+    index_workers = cfg.get('index-workers', None)
+
     # CONFIG DONE
 
     # HANDLE ARGUMENTS
@@ -258,48 +266,38 @@ def main():
     now = datetime.now()
     logger.info("Starting processing at: %s", now.strftime("%Y-%m-%d %H:%M:%S"))
 
-    fileno = 1
     files2ingest = []
     parentids = set()
     logger.info("Got %d input files.", len(myfiles))
     # logger.debug(myfiles)
+    files = []
     for myfile in myfiles:
         myfile = myfile.strip()
         # Decide files to operate on
-        if not myfile.endswith('.xml'):
+        if not myfile.endswith(('.xml', MMD_JSON_SUFFIX)):
             continue
         if args.list_file:
             myfile = myfile.rstrip()
         if args.directory:
             myfile = os.path.join(args.directory, myfile)
+        files.append(myfile)
+
+    """
+    Read, check and convert the files to the SolR format needed.
+    The conversion is CPU bound, so several files are converted in parallel processes.
+    """
+    logger.info('Checking MMD elements and converting to SolR format.')
+    if len(files) > 1:
+        with ProcessPoolExecutor() as executor:
+            converted = list(executor.map(mmd_file_to_solr_doc, files, chunksize=16))
+    else:
+        converted = [mmd_file_to_solr_doc(myfile) for myfile in files]
 
+    for fileno, (myfile, (newdoc, error)) in enumerate(zip(files, converted), start=1):
         # Index files
         logger.info('-- Processing file: %d - %s', fileno, myfile)
-
-        try:
-            mydoc = MMD4SolR(filename=myfile)
-        except Exception as e:
-            logger.warning('Could not handle file: %s. Error: %s', myfile, e)
-            continue
-        logger.info('Checking MMD elements.')
-
-        try:
-            mydoc.check_mmd()
-        except Exception as e:
-            logger.error(
-                'File: %s is not compliant with MMD specification. Error: %s', myfile, e)
-            continue
-        fileno += 1
-
-        """
-        Convert to the SolR format needed
-        """
-        logger.info('Converting to SolR format.')
-        try:
-            newdoc = mydoc.tosolr()
-        except Exception as e:
-            logger.error(
-                'Could not convert file %s to solr document.  Reason: %s', myfile, e)
+        if newdoc is None:
+            logger.error(error)
             continue
 
         """
@@ -339,16 +337,22 @@ def main():
 
     # Check if parents are in the existing list
     pending = parentids.copy()
+    # Parents already in the index are updated in batches
+    parent_batcher = SolrBatcher(mysolr.solrc, flush_at=100)
     for id in parentids:
         if not any(d['id'] == id for d in files2ingest):
             # Check if already ingested and update if so
             logger.info("Checking index for parent %s", id)
             status, msg = mysolr.update_parent(id, fail_on_missing=False,
-                                               handle_missing_status=False)
+                                               handle_missing_status=False,
+                                               batcher=parent_batcher)
 
             if status is True:
                 logger.info(msg)
                 pending.remove(id)
+            elif status is None:
+                # Queued, removed from pending once the update is sent
+                logger.info(msg)
             else:
                 logger.error(msg)
 
@@ -369,6 +373,7 @@ def main():
                             logger.info("Parent %s updated." % id)
                             pending.remove(id)
                 i += 1
+    pending -= mysolr.flush_parents(parent_batcher)
 
     if len(files2ingest) == 0:
         logger.warn('No files to ingest.')
@@ -386,7 +391,10 @@ def main():
         mylist = files2ingest[i:i+mystep]
         myrecs += len(mylist)
         try:
-            mysolr.index_record(mylist, addThumbnail=tflg, thumbClass=thumbClass)
+            mysolr.index_record(mylist, addThumbnail=tflg, thumbClass=thumbClass,
+                                batch_size=solr_batch_size,
+                                commit_within=solr_commit_within,
+                                workers=index_workers)
         except Exception as e:
             logger.warning('Something failed during indexing:s %s', e)
         logger.info('%d records out of %d have been ingested...',
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+SOLR-indexer : Convert MMD files to json
+========================================
+
+Copyright MET Norway
+
+Licensed under the GNU GENERAL PUBLIC LICENSE, Version 3; you may not
+use this file except in compliance with the License. You may obtain a
+copy of the License at
+
+    https://www.gnu.org/licenses/gpl-3.0.en.html
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+implied. See the License for the specific language governing
+permissions and limitations under the License.
+
+PURPOSE:
+    Convert MMD xml files to .mmd.json files next to them, with the
+    same content as the parsed xml. The indexers load these much
+    faster than the xml files, when the same files are indexed often.
+    The xml files are kept, as they are added to the index as well.
+"""
+
+import os
+import orjson
+import logging
+import argparse
+
+from concurrent.futures import ProcessPoolExecutor
+from solrindexer.tools import find_xml_files
+from solrindexer.multithread.io import load_file, MMD_JSON_SUFFIX
+
+logger = logging.getLogger(__name__)
+if os.getenv("SOLRINDEXER_LOGLEVEL", "INFO") == "DEBUG":
+    logger.setLevel(logging.DEBUG)
+    logger.debug("Loglevel was set to DEBUG")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--directory', required=True,
+                        help='Directory with mmd files to convert recursivly')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of processes to use. Default is the number of cpus')
+
+    return parser.parse_args()
+
+
+def convert_file(filename):
+    """
+    Convert one mmd xml file to json, stored next to the xml file.
+    Returns True if the file was converted.
+    """
+    mmd = load_file(filename)
+    if mmd is None:
+        return False
+    jsonfile = os.path.splitext(filename)[0] + MMD_JSON_SUFFIX
+    with open(jsonfile, 'wb') as fd:
+        fd.write(orjson.dumps(mmd))
+    return True
+
+
+def main():
+    args = parse_arguments()
+
+    files = find_xml_files(args.directory)
+    logger.info("Got %d input files.", len(files))
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        converted = sum(executor.map(convert_file, files, chunksize=16))
+    logger.info("Converted %d of %d files.", converted, len(files))
+    if converted != len(files):
+        logger.warning("One or more files could not be converted. Check the logs.")
+
+
+def _main():  # pragma: no cover
+    try:
+        main()  # entry point in setup.cfg
+    except ValueError as e:
+        print(e)
+    except AttributeError as e:
+        print(e)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -22,23 +22,25 @@ from .tools import flatten
 from .tools import rewrap
 from .tools import to_solr_id
 from .tools import getZones
-from .tools import parse_date
+from .tools import parse_date, parse_datetime
 from .tools import checkDateFormat
 from .tools import getListOfFiles
-from .tools import process_feature_type
+from .tools import process_feature_type, VALID_FEATURE_TYPES
 from .tools import initThumb
 from .tools import initSolr, find_xml_files
 from .tools import create_wms_thumbnail
 from .tools import create_wms_thumbnail_api_wrapper
-from .tools import get_dataset, solr_add, solr_commit
+from .tools import get_dataset, get_datasets, get_existing_ids
+from .tools import solr_add, solr_delete, solr_commit
 
 
 __package__ = "tools"
 __version__ = "2.0.2"
 __date__ = "2024-01-23"
 __all__ = ["flip", "rewrap", "to_solr_id",
-           "parse_date", "getZones", "checkDateFormat",
-           "getListOfFiles", "flatten", "process_feature_type",
+           "parse_date", "parse_datetime", "getZones", "checkDateFormat",
+           "getListOfFiles", "flatten", "process_feature_type", "VALID_FEATURE_TYPES",
            "initThumb", "create_wms_thumbnail", "initSolr",
-           "get_dataset", "solr_add", "solr_commit",
+           "get_dataset", "get_datasets", "get_existing_ids",
+           "solr_add", "solr_delete", "solr_commit",
            "create_wms_thumbnail_api_wrapper", "find_xml_files"]
@@ -20,15 +20,17 @@ limitations under the License.
 import os
 import re
 import math
+import orjson
 import fnmatch
+import functools
 import shapely
 import logging
 import requests
 import validators
-import netCDF4
 import dateutil.parser
 import subprocess
 
+from datetime import datetime
 from shapely import wkt
 from shapely.ops import transform
 
@@ -43,6 +45,13 @@ lock = Lock()
 
 IDREPLS = [':', '/', '.']
 
+# CF discrete sampling geometry feature types
+VALID_FEATURE_TYPES = frozenset(('point', 'timeSeries', 'trajectory', 'profile',
+                                 'timeSeriesProfile', 'trajectoryProfile'))
+
+# Largest number of bytes posted to solr in one add request
+SOLR_MAX_PAYLOAD = 16 * 1024 * 1024
+
 DATETIME_REGEX = re.compile(
     r"^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})T(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})(\.\d+)?Z$"  # NOQA: E501
 )
@@ -87,7 +96,9 @@ def get_dataset(id):
     """
     res = None
     try:
-        res = requests.get(solr_endpoint + '/get?wt=json&id=' + id,
+        res = requests.get(solr_endpoint + '/get',
+                           params={'wt': 'json', 'id': id},
+                           headers={'Accept': 'application/json'},
                            auth=authClass)
         res.raise_for_status()
     except requests.exceptions.HTTPError as errh:
@@ -106,9 +117,137 @@ def get_dataset(id):
         return dataset
 
 
-def solr_add(docs):
-    """Add documents to solr"""
-    solr_pysolr.add(docs)
+def get_datasets(ids):
+    """
+    Use real-time get to fetch the latest datasets
+    for several ids in one request.
+    Return a dict of the datasets found in the index, keyed by id.
+    If the index could not be checked, an empty dict is returned.
+    """
+    ids = list(ids)
+    if len(ids) == 0:
+        return {}
+    res = None
+    try:
+        # The ids are posted as form data, to not be limited by the url length
+        res = requests.post(solr_endpoint + '/get',
+                            data={'wt': 'json', 'ids': ids},
+                            headers={'Accept': 'application/json'},
+                            auth=authClass)
+        res.raise_for_status()
+    except requests.exceptions.HTTPError as errh:
+        logger.error("Http Error: %s", errh)
+        res = None
+    except requests.exceptions.ConnectionError as errc:
+        logger.error("Error Connecting: %s", errc)
+        res = None
+    except requests.exceptions.Timeout as errt:
+        logger.error("Timeout Error: %s", errt)
+        res = None
+    except requests.exceptions.RequestException as err:
+        logger.error("OOps: Something Else went wrong: %s", err)
+        res = None
+
+    if res is None:
+        return {}
+    else:
+        docs = res.json()['response']['docs']
+        return {doc['id']: doc for doc in docs}
+
+
+def get_existing_ids(ids):
+    """
+    Use real-time get to check which of the given ids
+    are already in the index, in one request.
+    Return the set of ids found. If the index could not be
+    checked, an empty set is returned.
+    """
+    ids = list(ids)
+    if len(ids) == 0:
+        return set()
+    res = None
+    try:
+        res = requests.post(solr_endpoint + '/get',
+                            data={'wt': 'json', 'fl': 'id', 'ids': ids},
+                            headers={'Accept': 'application/json'},
+                            auth=authClass)
+        res.raise_for_status()
+    except requests.exceptions.HTTPError as errh:
+        logger.error("Http Error: %s", errh)
+        res = None
+    except requests.exceptions.ConnectionError as errc:
+        logger.error("Error Connecting: %s", errc)
+        res = None
+    except requests.exceptions.Timeout as errt:
+        logger.error("Timeout Error: %s", errt)
+        res = None
+    except requests.exceptions.RequestException as err:
+        logger.error("OOps: Something Else went wrong: %s", err)
+        res = None
+
+    if res is None:
+        return set()
+    else:
+        return {doc['id'] for doc in res.json()['response']['docs']}
+
+
+def _is_null_value(value):
+    """None and blank strings are not sent to solr, as pysolr does"""
+    return value is None or (isinstance(value, str) and len(value.strip()) == 0)
+
+
+def solr_add(docs, solrc=None, commit_within=None):
+    """Add documents to solr, using the connection set by initSolr
+    unless another pysolr connection is given"""
+    if solrc is None:
+        solrc = solr_pysolr
+    params = {}
+    if solrc.always_commit:
+        params['commit'] = 'true'
+    if commit_within is not None:
+        params['commitWithin'] = commit_within
+    # The documents are serialized with orjson and posted directly,
+    # using the session and settings of the pysolr connection.
+    # Empty values are dropped, like pysolr does when it builds the documents.
+    # Batches larger than SOLR_MAX_PAYLOAD bytes are split in several requests.
+    payloads = [[]]
+    size = 2
+    for doc in docs:
+        data = orjson.dumps({k: v for k, v in doc.items() if not _is_null_value(v)})
+        if len(payloads[-1]) > 0 and size + len(data) + 1 > SOLR_MAX_PAYLOAD:
+            payloads.append([])
+            size = 2
+        payloads[-1].append(data)
+        size += len(data) + 1
+    for payload in payloads:
+        res = solrc.get_session().post(
+            solrc.url.rstrip('/') + '/update/',
+            data=b'[' + b','.join(payload) + b']',
+            params=params or None,
+            headers={'Content-Type': 'application/json; charset=utf-8'},
+            auth=solrc.auth, timeout=solrc.timeout,
+            verify=solrc.verify)
+        res.raise_for_status()
+
+
+def solr_delete(ids, solrc=None, commit_within=None):
+    """Delete documents with the given solr ids in one request, using the
+    connection set by initSolr unless another pysolr connection is given"""
+    if solrc is None:
+        solrc = solr_pysolr
+    params = {}
+    if solrc.always_commit:
+        params['commit'] = 'true'
+    if commit_within is not None:
+        params['commitWithin'] = commit_within
+    res = solrc.get_session().post(
+        solrc.url.rstrip('/') + '/update/',
+        data=orjson.dumps({'delete': list(ids)}),
+        params=params or None,
+        headers={'Content-Type': 'application/json; charset=utf-8'},
+        auth=solrc.auth, timeout=solrc.timeout,
+        verify=solrc.verify)
+    res.raise_for_status()
 
 
 def solr_commit():
@@ -126,9 +265,11 @@ def rewrap(x):
     return (x + 180) % 360 - 180
 
 
+@functools.lru_cache(maxsize=65536)
 def to_solr_id(id):
     """Function that translate from metadata_identifier
-    to solr compatilbe id field syntax
+    to solr compatilbe id field syntax.
+    Cached, as the same parent id is translated for every child.
     """
     solr_id = str(id)
     for e in IDREPLS:
@@ -137,6 +278,18 @@ def to_solr_id(id):
     return solr_id
 
 
+def parse_datetime(date):
+    """Parse a date string to datetime.
+    MMD dates are ISO 8601, which datetime.fromisoformat handles much
+    faster than dateutil. Other formats fall back to dateutil."""
+    try:
+        if date.endswith('Z'):
+            return datetime.fromisoformat(date[:-1] + '+00:00')
+        return datetime.fromisoformat(date)
+    except ValueError:
+        return dateutil.parser.parse(date)
+
+
 def parse_date(_date):
     """Function that tries to parse date from mmd
     into correct solr date format string"""
@@ -150,7 +303,7 @@ def parse_date(_date):
         return date
     elif not test:
         try:
-            parsed_date = dateutil.parser.parse(date)
+            parsed_date = parse_datetime(date)
             date = parsed_date.strftime('%Y-%m-%dT%H:%M:%SZ')
         except Exception as e:
             logger.error("Could not parse date: %s, reason: %s", date, e)
@@ -166,7 +319,7 @@ def parse_date(_date):
             if re.search(r'\+\d\d:\d\dZ$', date) is not None:
                 date = re.sub(r'\+\d\d:\d\d', '', date)
                 try:
-                    newdate = dateutil.parser.parse(date)
+                    newdate = parse_datetime(date)
                     date = newdate.strftime('%Y-%m-%dT%H:%M:%SZ')
                     logger.debug("parsed solr date: %s", date)
                 except Exception as e:
@@ -236,6 +389,22 @@ def flatten(mylist):
     return [item for sublist in mylist for item in sublist]
 
 
+@functools.lru_cache(maxsize=1024)
+def _dap_global_attributes(dapurl):
+    """
+    Read the featureType, geospatial_bounds and geospatial_bounds_crs
+    global attributes of an OPeNDAP dataset, None for the missing ones.
+    Many records can point to the same dataset, so the attributes are
+    cached. Failures are not cached, and raise.
+    """
+    # netCDF4 loads HDF5 and numpy, so it is only imported when a dataset is opened
+    import netCDF4
+    with netCDF4.Dataset(dapurl, 'r') as ds:
+        attrs = ds.ncattrs()
+        return tuple(ds.getncattr(name) if name in attrs else None
+                     for name in ('featureType', 'geospatial_bounds', 'geospatial_bounds_crs'))
+
+
 def process_feature_type(tmpdoc):
     """
     Look for feature type and update document
@@ -265,38 +434,20 @@ def process_feature_type(tmpdoc):
     #         dapurl = fileloc
     #         logger.debug("Setting dapurl to read from lustre location: %s", dapurl)
     if dapurl is not None:
-        logger.debug("Trying to open netCDF file: %s", dapurl)
-        # lock.acquire()
-        ds = None
+        logger.debug("Reading global attributes from netCDF file: %s", dapurl)
         try:
-            ds = netCDF4.Dataset(dapurl, 'r')
+            featureType, polygon, bounds_crs = _dap_global_attributes(dapurl)
         except Exception as e:
             logger.error("Something failed reading netcdf %s. Reason: %s", dapurl, e)
-            if ds is not None:
-                ds.close()
             # Set to inactive if file not found.
             # if str(e).ststartswith('[Errno -90] NetCDF: file not found:'):
             #     logger.info("Setting dataset %s to Inactive", tmpdoc_['metadata_identifier'])
             #     tmpdoc_.update({"metadata_status": "Inactive"})
             return tmpdoc_
 
-        # Try to get the global attribute featureType
-        featureType = None
-        try:
-            featureType = ds.getncattr('featureType')
-        except AttributeError:
-            pass
-        except Exception as e:
-            logger.error("Something failed extracting featureType: %s", str(e))
-            ds.close()
-            # lock.release()
-            return tmpdoc_
-
         if featureType is not None:
             logger.debug("Got featuretype: %s", featureType)
-            if featureType not in ['point', 'timeSeries',
-                                   'trajectory', 'profile', 'timeSeriesProfile',
-                                   'trajectoryProfile']:
+            if featureType not in VALID_FEATURE_TYPES:
                 logger.warning(
                     "The featureType found - %s - is not valid", featureType)
                 logger.warning("Fixing this locally")
@@ -312,25 +463,12 @@ def process_feature_type(tmpdoc):
                 logger.debug('Neither gridded nor discrete sampling \
                             geometry found in this record...')
 
-        polygon = None
-        try:
-            polygon = ds.getncattr('geospatial_bounds')
-        except AttributeError:
-            pass
-        except Exception as e:
-            logger.error("Something failed extracting geospatial_bounds: %s", str(e))
-            ds.close()
-            # lock.release()
-            return tmpdoc_
-            # Check if we have plogon.
-
         if polygon is not None:
             logger.debug("Reading geospatial_bounds")
             try:
                 polygon_ = wkt.loads(polygon)
             except Exception as e:
                 logger.warning("Could not parse geospatial_bounds: %s, Reason: %s", polygon, e)
-                ds.close()
                 return tmpdoc_
             geom_type = polygon_.geom_type
             logger.debug("Got geospatial type %s with bounds: %s", geom_type, polygon)
@@ -365,25 +503,11 @@ def process_feature_type(tmpdoc):
                     tmpdoc_.update({'geospatial_bounds': polygon.wkt})
                     tmpdoc_.update({'polygon_rpt': polygon.wkt})
 
-        bounds_crs = None
-        try:
-            bounds_crs = ds.getncattr('geospatial_bounds_crs')
-        except AttributeError:
-            pass
-        except Exception as e:
-            logger.error("Something failed extracting geospatial_bounds_crs: %s", str(e))
-            ds.close()
-            # lock.release()
-            return tmpdoc_
-            # Check if we have plogon.
         if bounds_crs is not None:
             crs = str(bounds_crs).strip()
             logger.debug("Got geospatial bounds CRS: %s", crs)
             tmpdoc_.update({'geographic_extent_polygon_srsName': crs})
 
-        logger.debug("Closing netCDF file.")
-        ds.close()
-        # lock.release()
         return tmpdoc_
 
     return tmpdoc_
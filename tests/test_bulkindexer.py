@@ -0,0 +1,64 @@
+import pytest
+
+from solrindexer.bulkindexer import BulkIndexer
+
+""" Global test variables"""
+solr_url = "http://localhost:8983/solr/mmd"
+
+
+@pytest.mark.indexdata
+def testResolveParentInBatch():
+    bulkindexer = BulkIndexer([], solr_url)
+    docs = [{'id': 'parent', 'isParent': False}, {'id': 'child', 'isParent': False}]
+    by_id = {'parent': 0, 'child': 1}
+    parent_updates = []
+    pending = {'parent'}
+    processed = set()
+    bulkindexer._resolve_parent('parent', docs, by_id, {}, parent_updates, pending, processed)
+    assert docs[0]['isParent'] is True
+    assert docs[1]['isParent'] is False
+    assert parent_updates == []
+    assert pending == set()
+    assert processed == {'parent'}
+
+
+@pytest.mark.indexdata
+def testResolveParentInIndex():
+    bulkindexer = BulkIndexer([], solr_url)
+    index_map = {'parent': {'id': 'parent', 'isParent': False, '_version_': 1}}
+    parent_updates = []
+    pending = {'parent'}
+    processed = set()
+    bulkindexer._resolve_parent('parent', [], {}, index_map, parent_updates, pending, processed)
+    assert parent_updates == [{'id': 'parent', 'isParent': True}]
+    assert pending == set()
+    assert processed == {'parent'}
+
+
+@pytest.mark.indexdata
+def testResolveParentAlreadyFlagged():
+    bulkindexer = BulkIndexer([], solr_url)
+    index_map = {'parent': {'id': 'parent', 'isParent': True}}
+    parent_updates = []
+    pending = set()
+    processed = set()
+    bulkindexer._resolve_parent('parent', [], {}, index_map, parent_updates, pending, processed)
+    assert parent_updates == []
+    assert pending == set()
+    assert processed == set()
+
+
+@pytest.mark.indexdata
+def testResolveParentPending():
+    bulkindexer = BulkIndexer([], solr_url)
+    parent_updates = []
+    pending = set()
+    processed = set()
+    # Not in the batch nor in the index, kept for later
+    bulkindexer._resolve_parent('parent', [], {}, {}, parent_updates, pending, processed)
+    assert pending == {'parent'}
+    # Not looked for in the index, left as it is
+    bulkindexer._resolve_parent('other', [], {}, None, parent_updates, pending, processed)
+    assert pending == {'parent'}
+    assert parent_updates == []
+    assert processed == set()
@@ -1,6 +1,7 @@
 import pytest
 
 from solrindexer.indexdata import MMD4SolR
+from solrindexer.indexdata import SolrBatcher
 
 """ Global test variables"""
 infile = "./tests/data/reference_nc.xml"
@@ -28,3 +29,35 @@ def testCheckMMd():
 def testToSolR():
     mydoc = MMD4SolR(infile)
     assert mydoc.tosolr
+
+
+@pytest.mark.indexdata
+def testSolrBatcherFlushAt(monkeypatch):
+    sent = []
+    monkeypatch.setattr("solrindexer.indexdata.solr_add",
+                        lambda docs, solrc=None, commit_within=None: sent.append(docs))
+    batcher = SolrBatcher(None, flush_at=2)
+    assert batcher.add({'id': 'a'}) == []
+    assert batcher.add({'id': 'b'}) == [{'id': 'a'}, {'id': 'b'}]
+    assert batcher.add({'id': 'c'}) == []
+    assert sent == [[{'id': 'a'}, {'id': 'b'}]]
+    assert batcher.flush() == [{'id': 'c'}]
+    assert batcher.flush() == []
+    assert sent == [[{'id': 'a'}, {'id': 'b'}], [{'id': 'c'}]]
+
+
+@pytest.mark.indexdata
+def testSolrBatcherContext(monkeypatch):
+    sent = []
+    monkeypatch.setattr("solrindexer.indexdata.solr_add",
+                        lambda docs, solrc=None, commit_within=None: sent.append(docs))
+    with SolrBatcher(None, flush_at=10) as batcher:
+        batcher.add({'id': 'a'})
+    assert sent == [[{'id': 'a'}]]
+
+    # The last batch is not sent when the block fails
+    with pytest.raises(ValueError):
+        with SolrBatcher(None, flush_at=10) as batcher:
+            batcher.add({'id': 'b'})
+            raise ValueError
+    assert sent == [[{'id': 'a'}]]
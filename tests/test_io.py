@@ -0,0 +1,28 @@
+import pytest
+import orjson
+import xmltodict
+
+from solrindexer.multithread.io import load_file
+
+""" Global test variables"""
+infile = "./tests/data/reference_nc.xml"
+
+
+@pytest.mark.indexdata
+def testLoadFile():
+    with open(infile, 'rb') as fd:
+        assert load_file(infile) == xmltodict.parse(fd.read())
+
+
+@pytest.mark.indexdata
+def testLoadFileNotXml(tmp_path):
+    nofile = tmp_path / "broken.xml"
+    nofile.write_text("<broken")
+    assert load_file(nofile) is None
+
+
+@pytest.mark.indexdata
+def testLoadFileJson(tmp_path):
+    jsonfile = tmp_path / "reference_nc.mmd.json"
+    jsonfile.write_bytes(orjson.dumps(load_file(infile)))
+    assert load_file(jsonfile) == load_file(infile)
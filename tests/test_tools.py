@@ -1,9 +1,12 @@
 import pytest
+import orjson
 
 from solrindexer.tools import getZones
 from solrindexer.tools import to_solr_id
 from solrindexer.tools import parse_date
+from solrindexer.tools import parse_datetime
 from solrindexer.tools import checkDateFormat
+from solrindexer.tools import solr_add
 
 
 @pytest.mark.indexdata
@@ -31,6 +34,13 @@ def testParseGenericDate():
     assert parse_date(date) == parsed_date
 
 
+@pytest.mark.indexdata
+def testParseDatetime():
+    iso_date = parse_datetime("2022-02-28T14:26:33Z")
+    other_date = parse_datetime("28 Feb 2022 14:26:33 UTC")
+    assert iso_date == other_date
+
+
 @pytest.mark.indexdata
 def testDateFormatValid():
     valid_date = "2022-02-28T14:26:33Z"
@@ -41,3 +51,52 @@ def testDateFormatValid():
 def testDateFormatInValid():
     not_valid_date = "2022-02-28T14:26:33.905269+00:0"
     assert checkDateFormat(not_valid_date) is False
+
+
+
+class FakeSession:
+    """Record the requests posted by solr_add"""
+
+    def __init__(self):
+        self.posted = []
+
+    def post(self, url, **kwargs):
+        self.posted.append(kwargs)
+        return self
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSolr:
+    url = "http://localhost:8983/solr/mmd/"
+    always_commit = False
+    auth = None
+    timeout = 60
+    verify = True
+
+    def __init__(self):
+        self.session = FakeSession()
+
+    def get_session(self):
+        return self.session
+
+
+@pytest.mark.indexdata
+def testSolrAddDropsEmptyValues():
+    solrc = FakeSolr()
+    solr_add([{'id': 'a', 'title': 'A', 'checksum_type': '', 'size': None,
+               'blank': '  ', 'isParent': False, 'keywords': []}], solrc=solrc)
+    payload = orjson.loads(solrc.session.posted[0]['data'])
+    assert payload == [{'id': 'a', 'title': 'A', 'isParent': False, 'keywords': []}]
+
+
+@pytest.mark.indexdata
+def testSolrAddSplitsLargePayloads(monkeypatch):
+    monkeypatch.setattr("solrindexer.tools.tools.SOLR_MAX_PAYLOAD", 40)
+    solrc = FakeSolr()
+    docs = [{'id': 'doc%d' % i, 'title': 'Title'} for i in range(3)]
+    solr_add(docs, solrc=solrc)
+    payloads = [orjson.loads(post['data']) for post in solrc.session.posted]
+    assert len(payloads) == 3
+    assert [doc for payload in payloads for doc in payload] == docs